@@ -0,0 +1,336 @@
+"""
+Thread lifecycle benchmark, run from the repository root:
+
+    pip install -r benchmarks/requirements.txt
+    python benchmarks/lifecycle_bench.py [--iterations 20] [--mongo-rtt 0] [--http-rtt 0]
+
+Drives Mail._user_create_thread, Mail._reply, Mail._close_generic, utils._info and
+utils._trigger_create_user_thread against benchmarks.standins: mongomock behind an async
+client shaped like pymongo's, and fake discord.py objects that count REST calls instead of
+making them. Nothing leaves the process and the real config.py is never imported.
+
+Per operation it reports p50/p99 latency, Mongo queries and Discord REST calls, and the time
+spent inside mongomock (which stands in for the server, so it is not the bot's own cost).
+Transcript appends are written behind, so their batches show up in each scenario's totals
+"""
+
+import argparse
+import asyncio
+import collections
+import functools
+import os
+import random
+import sys
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Fixture IDs for the fake guilds, installed in place of config.py before any cog imports it
+benchConfig = types.ModuleType('config')
+benchConfig.__dict__.update(
+    token='token',
+    mongoURI='mongodb://stand-in',
+    modLog=1101,
+    adminChannel=1102,
+    forumChannel=1100,
+    category=1103,
+    guild=1000,
+    appealGuild=1001,
+    leadModRole=1200,
+    modRole=1201,
+    trialModRole=1202,
+    addTick='<:addTickL:951241243604713492>',
+    removeTick='<:removeTickL:951249921862926367>',
+    userThreadTag=1300,
+    modThreadTag=1301,
+    banAppealTag=1302,
+    messageReportTag=1303,
+    logUrl='https://example.com/logs/',
+    appealInvite='https://discord.gg/invite',
+    transcriptFlushWindow=0.05,
+)
+sys.modules['config'] = benchConfig
+
+import config  # noqa: E402
+
+from benchmarks import standins  # noqa: E402
+
+import cogs.database as database  # noqa: E402
+import cogs.modmail as modmail  # noqa: E402
+import cogs.utils as utils  # noqa: E402
+
+punTypes = ['note', 'note', 'strike', 'destrike', 'tier1', 'tier2', 'mute', 'unmute', 'kick', 'clear']
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, round(pct / 100 * (len(ordered) - 1)))]
+
+
+class Recorder:
+    """
+    Collects one sample per measured call: (seconds, mongo queries, REST calls, seconds inside mongomock).
+    Counts are deltas of the stand-in totals, so they are only per-call exact when calls don't overlap
+    """
+
+    def __init__(self):
+        self.world = None
+        self.samples = collections.defaultdict(list)
+
+    async def measure(self, name, awaitable):
+        mongo, http = self.world.mongo, self.world.http
+        queries, calls, engine = mongo.total, http.total, mongo.engineTime
+        start = time.perf_counter()
+        try:
+            return await awaitable
+
+        finally:
+            self.samples[name].append(
+                (
+                    time.perf_counter() - start,
+                    mongo.total - queries,
+                    http.total - calls,
+                    mongo.engineTime - engine,
+                )
+            )
+
+    def instrument(self, module, name, label):
+        """
+        Replaces module.name with a timed wrapper so nested calls are measured too. Returns the original
+        """
+        func = getattr(module, name)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            return await self.measure(label, func(*args, **kwargs))
+
+        setattr(module, name, wrapper)
+        return func
+
+    def report(self, title, totals):
+        print(f'\n{title}')
+        print(f'  {"operation":<46}{"n":>5}{"p50 ms":>9}{"p99 ms":>9}{"mongo/op":>10}{"rest/op":>9}{"engine ms":>11}')
+        for name, samples in self.samples.items():
+            seconds = [s[0] for s in samples]
+            count = len(samples)
+            if samples[0][1] is None:
+                counts = f'{"-":>10}{"-":>9}{"-":>11}'
+
+            else:
+                counts = (
+                    f'{sum(s[1] for s in samples) / count:>10.1f}{sum(s[2] for s in samples) / count:>9.1f}'
+                    f'{sum(s[3] for s in samples) / count * 1000:>11.2f}'
+                )
+
+            print(
+                f'  {name:<46}{count:>5}'
+                f'{percentile(seconds, 50) * 1000:>9.2f}{percentile(seconds, 99) * 1000:>9.2f}{counts}'
+            )
+
+        print(f'  {totals}')
+        self.samples.clear()
+
+
+class World:
+    """
+    A fresh primary guild, forum, moderator and Mail cog on top of new stand-ins
+    """
+
+    def __init__(self, args, recorder):
+        self.mongo = standins.MongoStandIn(args.mongo_rtt / 1000)
+        self.http = standins.FakeHTTP(args.http_rtt / 1000)
+        database._client = self.mongo
+        utils.openThreads.clear()
+        utils.userDocCache.clear()
+        recorder.world = self
+
+        self.bot = standins.FakeBot(self.http)
+        self.guild = self.bot.add_guild(config.guild, 'r/NintendoSwitch')
+        self.bot.add_guild(config.appealGuild, 'r/NintendoSwitch Ban Appeals')
+        self.modRole = self.guild.add_role(config.modRole, 'Chat-Mods')
+        self.guild.add_role(config.trialModRole, 'Trial Chat-Mods')
+        self.guild.add_role(config.leadModRole, 'Lead Chat-Mods')
+        self.roles = [self.guild.add_role(1400 + i, f'Role {i}') for i in range(40)]
+        self.forum = self.guild.add_channel(
+            standins.FakeForum(self.http, self.guild, 'modmail', config.category, config.forumChannel)
+        )
+        self.modLog = self.guild.add_channel(
+            standins.FakeTextChannel(self.http, self.guild, 'mod-log', id=config.modLog)
+        )
+        self.guild.add_channel(standins.FakeTextChannel(self.http, self.guild, 'admin', id=config.adminChannel))
+        self.guild.owner = self.guild.add_member('owner')
+        self.moderator = self.guild.add_member('moderator', roles=[self.modRole])
+        self.mail = modmail.Mail(self.bot)
+        self.mail.ready.set()  # The bench doesn't run Mail's startup, the stand-ins need no warm-up
+
+    def add_user(self, history=0):
+        """
+        Adds a member with a bowser.users document and `history` punishments, plus twenty
+        messages and a tenth as many previous threads (at least one). Seeding isn't counted
+        """
+        member = self.guild.add_member(f'user{len(self.guild.members)}', roles=random.sample(self.roles, 8))
+        self.bot.users[member.id] = member
+        engine = self.mongo._client
+        engine.bowser.users.insert_one({'_id': member.id, 'modmail': True, 'roles': [r.id for r in member.roles]})
+        now = int(time.time())
+        if history:
+            puns = []
+            for i in range(history):
+                punType = punTypes[i % len(punTypes)]
+                puns.append(
+                    {
+                        '_id': f'{member.id}-{i}',
+                        'user': member.id,
+                        'moderator': self.moderator.id,
+                        'type': punType,
+                        'timestamp': now - i * 3600,
+                        'reason': f'Reason for {punType} number {i} ' * 3,
+                        'expiry': now + 86400 if punType == 'mute' else None,
+                        'active': i < 10 and punType in ('strike', 'mute', 'tier1'),
+                        'strike_count': 1 if punType in ('strike', 'destrike') else None,
+                        'active_strike_count': 1 if punType == 'strike' else None,
+                    }
+                )
+
+            engine.bowser.puns.insert_many(puns)
+            engine.bowser.messages.insert_many(
+                [{'author': member.id, 'timestamp': now - i * 60} for i in range(history * 20)]
+            )
+            engine.modmail.logs.insert_many(
+                [
+                    {
+                        '_id': f'{member.id}-closed-{i}',
+                        'open': False,
+                        'channel_id': str(i),
+                        'guild_id': str(config.guild),
+                        'recipient': {'id': str(member.id), 'name': member.name},
+                        'creator': {'id': str(member.id), 'name': member.name},
+                        'messages': [{'content': 'Old message ' * 10} for _ in range(50)],
+                    }
+                    for i in range(max(1, history // 10))
+                ]
+            )
+
+        return member
+
+    def dm(self, member, content='Hello, I would like to ask about a rule'):
+        return standins.FakeMessage(self.http, member.dm_channel, content, author=member)
+
+    def thread_channel(self, member):
+        return self.bot.get_channel(utils.openThreads.by_recipient(member.id).channel_id)
+
+    async def totals(self, started):
+        await utils.transcriptWriter.flush()
+        return (
+            f'totals: {self.mongo.total} queries, {self.http.total} REST calls, '
+            f'{utils.transcriptWriter.flushes} transcript batches, {time.perf_counter() - started:.2f}s wall'
+        )
+
+    async def close(self):
+        await utils.transcriptWriter.flush()
+        await self.mail.attachmentRelay.close()
+
+
+async def lifecycle(world, recorder, member, loadInfo):
+    """
+    One full thread: first DM opens it, a moderator replies, the thread is closed, then the info card is pulled
+    """
+    mail = world.mail
+    await recorder.measure('Mail._user_create_thread (new thread)', mail._user_create_thread(world.dm(member)))
+    channel = world.thread_channel(member)
+    await recorder.measure(
+        'Mail._reply', mail._reply(standins.FakeInteraction(world.http, world.moderator, channel), 'Hi!', [])
+    )
+    await recorder.measure('Mail._close_generic', mail._close_generic(world.moderator, world.guild, channel, None))
+    ctx = standins.FakeContext(standins.FakeMessage(world.http, world.modLog, '', author=world.moderator))
+    await recorder.measure('utils._info (loads data)', loadInfo(ctx, world.bot, member))
+
+
+async def scenario_users(args, recorder, loadInfo, title, history):
+    world = World(args, recorder)
+    members = [world.add_user(history) for _ in range(args.iterations)]
+    started = time.perf_counter()
+    for member in members:
+        await lifecycle(world, recorder, member, loadInfo)
+
+    recorder.report(f'{title} ({args.iterations} users)', await world.totals(started))
+    await world.close()
+
+
+async def scenario_long_thread(args, recorder):
+    world = World(args, recorder)
+    threads = max(2, args.iterations // 5)
+    members = [world.add_user(args.history // 10) for _ in range(threads)]
+    started = time.perf_counter()
+    for member in members:
+        await world.mail._user_create_thread(world.dm(member))
+        channel = world.thread_channel(member)
+        for i in range(args.thread_messages // 2):
+            await recorder.measure(
+                'Mail._user_create_thread (append)', world.mail._user_create_thread(world.dm(member, f'Message {i}'))
+            )
+            interaction = standins.FakeInteraction(world.http, world.moderator, channel)
+            await recorder.measure('Mail._reply', world.mail._reply(interaction, f'Reply {i}', []))
+
+        await recorder.measure(
+            f'Mail._close_generic ({args.thread_messages} messages)',
+            world.mail._close_generic(world.moderator, world.guild, channel, None),
+        )
+
+    recorder.report(f'{args.thread_messages}-message thread ({threads} threads)', await world.totals(started))
+    await world.close()
+
+
+async def scenario_burst(args, recorder):
+    world = World(args, recorder)
+    members = [world.add_user() for _ in range(args.burst_users)]
+    messages = [world.dm(member, f'Burst {i}') for i in range(args.burst_messages) for member in members]
+    started = time.perf_counter()
+    await asyncio.gather(*[recorder.measure('Mail.on_message (burst)', world.mail.on_message(m)) for m in messages])
+    elapsed = time.perf_counter() - started
+
+    # Overlapping calls make per-call deltas meaningless. Spread the burst's totals evenly over its messages,
+    # and only keep latencies for the nested calls
+    for name, samples in recorder.samples.items():
+        recorder.samples[name] = [(s[0], None, None, None) for s in samples]
+
+    samples = recorder.samples['Mail.on_message (burst)']
+    share = (world.mongo.total / len(samples), world.http.total / len(samples), world.mongo.engineTime / len(samples))
+    recorder.samples['Mail.on_message (burst)'] = [(s[0], *share) for s in samples]
+    stats = world.mail.dmDispatcher.stats()
+    recorder.report(
+        f'DM burst ({args.burst_users} users x {args.burst_messages} messages, {len(messages) / elapsed:.0f} msg/s, '
+        f'peak queue {stats["peak_depth"]}, max wait {stats["max_wait"] * 1000:.1f} ms)',
+        await world.totals(started),
+    )
+    await world.close()
+
+
+async def main(args):
+    random.seed(0)
+    recorder = Recorder()
+    loadInfo = utils._info
+    recorder.instrument(utils, '_trigger_create_user_thread', 'utils._trigger_create_user_thread')
+    recorder.instrument(utils, '_info', 'utils._info (prefetched data)')
+
+    print(
+        f'mongo rtt {args.mongo_rtt} ms, REST rtt {args.http_rtt} ms. '
+        'engine ms is time spent inside mongomock, standing in for the server'
+    )
+    await scenario_users(args, recorder, loadInfo, 'Cold user', 0)
+    await scenario_users(args, recorder, loadInfo, f'Heavy-history user ({args.history} punishments)', args.history)
+    await scenario_long_thread(args, recorder)
+    await scenario_burst(args, recorder)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=20, help='users per cold/heavy scenario')
+    parser.add_argument('--history', type=int, default=300, help='punishments for heavy-history users')
+    parser.add_argument('--thread-messages', type=int, default=100, help='messages per long thread')
+    parser.add_argument('--burst-users', type=int, default=50)
+    parser.add_argument('--burst-messages', type=int, default=5, help='DMs per user in the burst')
+    parser.add_argument('--mongo-rtt', type=float, default=0.0, help='simulated Mongo round trip, ms')
+    parser.add_argument('--http-rtt', type=float, default=0.0, help='simulated Discord REST round trip, ms')
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,92 @@
+"""
+Micro-benchmark for cogs.render, run from the repository root:
+
+    python benchmarks/render_bench.py [iterations]
+
+Times snapshotting, rendering and discord.Embed construction per message for a plain DM,
+a DM with attachments, and a report with a cached reply chain (cold and memoized)
+"""
+
+import os
+import sys
+import timeit
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import discord  # noqa: E402
+
+import cogs.render as render  # noqa: E402
+
+
+class FakeAuthor:
+    def __init__(self, id):
+        self.id = id
+        self.display_avatar = SimpleNamespace(url=f'https://cdn.example/{id}.png')
+
+    def __str__(self):
+        return f'user{self.id}'
+
+
+def build_message(id, content, reference=None):
+    return SimpleNamespace(
+        id=id,
+        content=content,
+        author=FakeAuthor(100 + id),
+        channel=SimpleNamespace(id=42),
+        jump_url=f'https://discord.com/channels/@me/42/{id}',
+        message_snapshots=[],
+        stickers=[],
+        reference=SimpleNamespace(cached_message=reference) if reference else None,
+        edited_at=None,
+    )
+
+
+def bench(label, func, iterations):
+    seconds = min(timeit.repeat(func, number=iterations, repeat=5))
+    print(f'{label:<40} {seconds / iterations * 1e6:8.2f} µs/op')
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    plain = build_message(1, 'Hello, I have a question about my mute ' * 4)
+    attachments = ['https://cdn.example/a.png?ex=1', 'https://cdn.example/b.txt', 'https://cdn.example/c.mp4']
+    single = ['https://cdn.example/screenshot.PNG?ex=abc-123']
+
+    chain = None
+    for i in range(10, 14):
+        chain = build_message(i, f'Reply number {i} ' * 30, chain)
+
+    report = build_message(20, 'This message breaks the rules', chain)
+
+    def render_dm():
+        snapshot = render.snapshot_message(plain, single)
+        content, payload = render.render_message_embed(snapshot)
+        discord.Embed.from_dict(payload)
+
+    def render_attachments():
+        snapshot = render.snapshot_message(plain, attachments)
+        content, payload = render.render_message_embed(snapshot)
+        discord.Embed.from_dict(payload)
+
+    def render_report_cold():
+        render.replyFieldCache.clear()
+        snapshot = render.snapshot_message(report, [], report=True)
+        content, payload = render.render_message_embed(snapshot, report=True)
+        discord.Embed.from_dict(payload)
+
+    def render_report_warm():
+        snapshot = render.snapshot_message(report, [], report=True)
+        content, payload = render.render_message_embed(snapshot, report=True)
+        discord.Embed.from_dict(payload)
+
+    print(f'{iterations} iterations, best of 5')
+    bench('is_image', lambda: render.is_image(single[0]), iterations)
+    bench('DM, one image attachment', render_dm, iterations)
+    bench('DM, three attachments', render_attachments, iterations)
+    bench('report, 4 replies, cold reply cache', render_report_cold, iterations)
+    bench('report, 4 replies, memoized', render_report_warm, iterations)
+
+
+if __name__ == '__main__':
+    main()
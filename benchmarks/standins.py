@@ -0,0 +1,493 @@
+"""
+In-process stand-ins for the benchmark harness: an async wrapper over mongomock shaped like the
+pymongo AsyncMongoClient surface the cogs use, and fake discord.py objects whose REST calls are
+counted instead of sent. Both can add a simulated round trip so awaits yield like the real thing
+"""
+
+import asyncio
+import collections
+import itertools
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import discord
+import mongomock
+import pymongo
+
+snowflakes = itertools.count(900000000000000000)
+
+
+class MongoStandIn:
+    """
+    Drop-in for cogs.database._client. Every awaited collection call counts as one query,
+    keyed by (namespace, operation), and the time spent inside mongomock is tracked separately
+    so it can be told apart from the bot's own overhead
+
+    rtt: float, seconds each query sleeps to simulate a network round trip
+    """
+
+    def __init__(self, rtt=0.0):
+        self.rtt = rtt
+        self.queries = collections.Counter()
+        self.total = 0
+        self.engineTime = 0.0
+        self._client = mongomock.MongoClient()
+
+    def __getitem__(self, name):
+        return StandInDatabase(self, self._client[name])
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        return self[name]
+
+    async def close(self):
+        pass
+
+    async def roundtrip(self, namespace, op, func, *args, **kwargs):
+        self.queries[(namespace, op)] += 1
+        self.total += 1
+        await asyncio.sleep(self.rtt)  # The driver always yields to the loop, even with no simulated latency
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+
+        finally:
+            self.engineTime += time.perf_counter() - start
+
+
+class StandInDatabase:
+    def __init__(self, client, database):
+        self._client = client
+        self._database = database
+
+    def __getitem__(self, name):
+        return StandInCollection(self._client, self._database[name])
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+
+        return self[name]
+
+
+class StandInCollection:
+    def __init__(self, client, collection):
+        self._client = client
+        self._collection = collection
+        self.namespace = collection.full_name
+
+    def _roundtrip(self, op, func, *args, **kwargs):
+        return self._client.roundtrip(self.namespace, op, func, *args, **kwargs)
+
+    async def find_one(self, *args, **kwargs):
+        return await self._roundtrip('find', self._collection.find_one, *args, **kwargs)
+
+    def find(self, *args, **kwargs):
+        return StandInCursor(self._client, self.namespace, 'find', lambda: list(self._collection.find(*args, **kwargs)))
+
+    async def aggregate(self, pipeline, **kwargs):
+        docs = await self._roundtrip('aggregate', lambda: list(self._collection.aggregate(pipeline, **kwargs)))
+        return StandInCursor(self._client, self.namespace, 'aggregate', lambda: docs, fetched=True)
+
+    async def count_documents(self, *args, **kwargs):
+        return await self._roundtrip('count', self._collection.count_documents, *args, **kwargs)
+
+    async def insert_one(self, *args, **kwargs):
+        return await self._roundtrip('insert', self._collection.insert_one, *args, **kwargs)
+
+    async def insert_many(self, *args, **kwargs):
+        return await self._roundtrip('insert', self._collection.insert_many, *args, **kwargs)
+
+    async def update_one(self, *args, **kwargs):
+        return await self._roundtrip('update', self._collection.update_one, *args, **kwargs)
+
+    async def update_many(self, *args, **kwargs):
+        return await self._roundtrip('update', self._collection.update_many, *args, **kwargs)
+
+    async def delete_one(self, *args, **kwargs):
+        return await self._roundtrip('delete', self._collection.delete_one, *args, **kwargs)
+
+    async def create_index(self, *args, **kwargs):
+        return await self._roundtrip('createIndexes', self._collection.create_index, *args, **kwargs)
+
+    async def index_information(self):
+        return await self._roundtrip('listIndexes', self._collection.index_information)
+
+    async def bulk_write(self, requests, ordered=True):
+        # mongomock's own bulk_write predates the sort option pymongo 4.11+ passes, apply the requests one by one
+        def apply():
+            for request in requests:
+                if isinstance(request, pymongo.InsertOne):
+                    self._collection.insert_one(request._doc)
+
+                elif isinstance(request, pymongo.UpdateOne):
+                    self._collection.update_one(request._filter, request._doc, upsert=request._upsert)
+
+                elif isinstance(request, pymongo.UpdateMany):
+                    self._collection.update_many(request._filter, request._doc, upsert=request._upsert)
+
+                else:
+                    raise NotImplementedError(f'{type(request).__name__} is not supported by the stand-in')
+
+        return await self._roundtrip('bulkWrite', apply)
+
+
+class StandInCursor:
+    def __init__(self, client, namespace, op, fetch, fetched=False):
+        self._client = client
+        self._namespace = namespace
+        self._op = op
+        self._fetch = fetch
+        self._docs = None
+        self._fetched = fetched
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def _load(self):
+        if self._docs is None:
+            if self._fetched:
+                self._docs = collections.deque(self._fetch())
+
+            else:
+                self._docs = collections.deque(await self._client.roundtrip(self._namespace, self._op, self._fetch))
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        await self._load()
+        if not self._docs:
+            raise StopAsyncIteration
+
+        return self._docs.popleft()
+
+    async def next(self):
+        return await self.__anext__()
+
+    async def to_list(self, length=None):
+        await self._load()
+        docs = list(self._docs)[:length]
+        self._docs.clear()
+        return docs
+
+
+class FakeHTTP:
+    """
+    Stands in for discord.py's HTTP client. Every fake REST call is counted by route
+
+    rtt: float, seconds each call sleeps to simulate a REST round trip
+    """
+
+    def __init__(self, rtt=0.0):
+        self.rtt = rtt
+        self.calls = collections.Counter()
+        self.total = 0
+
+    async def request(self, route):
+        self.calls[route] += 1
+        self.total += 1
+        await asyncio.sleep(self.rtt)
+
+
+def not_found(message):
+    return discord.NotFound(SimpleNamespace(status=404, reason='Not Found'), message)
+
+
+class FakeAsset:
+    def __init__(self, url):
+        self.url = url
+
+    def __str__(self):
+        return self.url
+
+    def with_static_format(self, format):
+        return self
+
+    def with_size(self, size):
+        return self
+
+
+class FakeRole:
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+
+    def __eq__(self, other):
+        return isinstance(other, FakeRole) and other.id == self.id
+
+    def __hash__(self):
+        return hash(self.id)
+
+
+class FakeUser:
+    def __init__(self, http, name, id=None, bot=False, dms_open=True):
+        self.http = http
+        self.id = id or next(snowflakes)
+        self.name = name
+        self.discriminator = '0'
+        self.bot = bot
+        self.dms_open = dms_open
+        self.display_avatar = FakeAsset(f'https://cdn.discordapp.com/avatars/{self.id}/a.png')
+        self.created_at = datetime.now(tz=timezone.utc) - timedelta(days=900)
+        self.dm_channel = FakeDMChannel(self)
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def mention(self):
+        return f'<@{self.id}>'
+
+    async def send(self, content=None, **kwargs):
+        await self.http.request('POST /channels/{channel.id}/messages')
+        if not self.dms_open:
+            raise discord.Forbidden(
+                SimpleNamespace(status=403, reason='Forbidden'), 'Cannot send messages to this user'
+            )
+
+        return FakeMessage(self.http, self.dm_channel, content or '', author=None)
+
+
+class FakeMember(FakeUser):
+    def __init__(self, http, guild, name, roles=(), **kwargs):
+        super().__init__(http, name, **kwargs)
+        self.guild = guild
+        self.roles = [guild.default_role, *roles]
+        self.joined_at = datetime.now(tz=timezone.utc) - timedelta(days=400)
+
+    async def kick(self, reason=None):
+        await self.http.request('DELETE /guilds/{guild.id}/members/{user.id}')
+
+    async def ban(self, reason=None):
+        await self.http.request('PUT /guilds/{guild.id}/bans/{user.id}')
+
+
+class FakeDMChannel:
+    def __init__(self, recipient):
+        self.id = next(snowflakes)
+        self.recipient = recipient
+        self.type = discord.ChannelType.private
+        self.guild = None
+        self.name = None
+
+
+class FakeMessage:
+    def __init__(self, http, channel, content, author, attachments=()):
+        self.http = http
+        self.id = next(snowflakes)
+        self.channel = channel
+        self.guild = channel.guild
+        self.content = content
+        self.author = author
+        self.type = discord.MessageType.default
+        self.attachments = list(attachments)
+        self.stickers = []
+        self.message_snapshots = []
+        self.reference = None
+        self.edited_at = None
+        self.created_at = datetime.now(tz=timezone.utc)
+        guildID = channel.guild.id if channel.guild else '@me'
+        self.jump_url = f'https://discord.com/channels/{guildID}/{channel.id}/{self.id}'
+
+    async def add_reaction(self, emoji):
+        await self.http.request('PUT /channels/{channel.id}/messages/{message.id}/reactions/{emoji}/@me')
+
+
+class FakeTextChannel:
+    def __init__(self, http, guild, name, category_id=None, id=None):
+        self.http = http
+        self.id = id or next(snowflakes)
+        self.guild = guild
+        self.name = name
+        self.category_id = category_id
+        self.type = discord.ChannelType.text
+        self.jump_url = f'https://discord.com/channels/{guild.id}/{self.id}'
+        self.sent = 0
+
+    async def send(self, content=None, **kwargs):
+        await self.http.request('POST /channels/{channel.id}/messages')
+        self.sent += 1
+        return FakeMessage(self.http, self, content or '', author=None)
+
+    async def edit(self, **kwargs):
+        await self.http.request('PATCH /channels/{channel.id}')
+
+    async def typing(self):
+        await self.http.request('POST /channels/{channel.id}/typing')
+
+
+class FakeThread(FakeTextChannel):
+    def __init__(self, http, guild, name, category_id):
+        super().__init__(http, guild, name, category_id)
+        self.type = discord.ChannelType.public_thread
+
+    async def delete(self):
+        await self.http.request('DELETE /channels/{channel.id}')
+
+
+class FakeForum(FakeTextChannel):
+    def __init__(self, http, guild, name, category_id=None, id=None):
+        super().__init__(http, guild, name, category_id, id)
+        self.type = discord.ChannelType.forum
+
+    def get_tag(self, tag_id):
+        return discord.Object(id=tag_id)
+
+    async def create_thread(self, name, content=None, embed=None, **kwargs):
+        await self.http.request('POST /channels/{channel.id}/threads')
+        thread = FakeThread(self.http, self.guild, name, self.category_id)
+        self.guild.channels[thread.id] = thread
+        return thread, FakeMessage(self.http, thread, content or '', author=None)
+
+
+class FakeGuild:
+    def __init__(self, http, id, name):
+        self.http = http
+        self.id = id
+        self.name = name
+        self.default_role = FakeRole(id, '@everyone')
+        self.roles = {id: self.default_role}
+        self.members = {}
+        self.bans = set()
+        self.channels = {}
+        self.owner = None
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def owner_id(self):
+        return self.owner.id if self.owner else None
+
+    def add_role(self, id, name):
+        self.roles[id] = FakeRole(id, name)
+        return self.roles[id]
+
+    def add_channel(self, channel):
+        self.channels[channel.id] = channel
+        return channel
+
+    def add_member(self, name, roles=(), **kwargs):
+        member = FakeMember(self.http, self, name, roles, **kwargs)
+        self.members[member.id] = member
+        return member
+
+    def get_role(self, id):
+        return self.roles.get(id)
+
+    def get_member(self, id):
+        return self.members.get(id)
+
+    def get_channel(self, id):
+        return self.channels.get(id)
+
+    async def fetch_member(self, id):
+        await self.http.request('GET /guilds/{guild.id}/members/{user.id}')
+        if id not in self.members:
+            raise not_found('Unknown Member')
+
+        return self.members[id]
+
+    async def fetch_ban(self, user):
+        await self.http.request('GET /guilds/{guild.id}/bans/{user.id}')
+        if user.id not in self.bans:
+            raise not_found('Unknown Ban')
+
+        return SimpleNamespace(user=user, reason=None)
+
+
+class FakeContext:
+    def __init__(self, message):
+        self.message = message
+        self.channel = message.channel
+        self.guild = message.guild
+
+    async def send(self, content=None, **kwargs):
+        return await self.channel.send(content, **kwargs)
+
+
+class FakeBot:
+    """
+    The subset of commands.Bot the Mail cog and cogs.utils touch, backed by FakeHTTP
+    """
+
+    def __init__(self, http):
+        self.http = http
+        self.user = FakeUser(http, 'Parakarry', bot=True)
+        self.guilds = {}
+        self.users = {}
+        self.tree = SimpleNamespace(add_command=lambda *args, **kwargs: None)
+
+    def add_guild(self, id, name):
+        self.guilds[id] = FakeGuild(self.http, id, name)
+        return self.guilds[id]
+
+    def get_guild(self, id):
+        return self.guilds.get(id)
+
+    def get_channel(self, id):
+        for guild in self.guilds.values():
+            channel = guild.get_channel(id)
+            if channel:
+                return channel
+
+        return None
+
+    def get_user(self, id):
+        return self.users.get(id)
+
+    async def fetch_channel(self, id):
+        await self.http.request('GET /channels/{channel.id}')
+        channel = self.get_channel(id)
+        if not channel:
+            raise not_found('Unknown Channel')
+
+        return channel
+
+    async def fetch_user(self, id):
+        await self.http.request('GET /users/{user.id}')
+        if id not in self.users:
+            raise not_found('Unknown User')
+
+        return self.users[id]
+
+    async def get_context(self, message):
+        return FakeContext(message)
+
+
+class FakeInteraction:
+    """
+    A slash command invocation in a thread channel, enough for Mail._reply
+    """
+
+    def __init__(self, http, user, channel):
+        self.http = http
+        self.user = user
+        self.channel = channel
+        self.guild = channel.guild
+        self._done = False
+        self._response = None
+        self.response = SimpleNamespace(defer=self._defer, send_message=self._send, is_done=lambda: self._done)
+        self.followup = SimpleNamespace(send=self._send)
+
+    async def _defer(self, **kwargs):
+        await self.http.request('POST /interactions/{interaction.id}/{interaction.token}/callback')
+        self._done = True
+
+    async def _send(self, content=None, **kwargs):
+        route = 'POST /webhooks/{application.id}/{interaction.token}' if self._done else 'POST /interactions/callback'
+        await self.http.request(route)
+        self._done = True
+        self._response = FakeMessage(self.http, self.channel, content or '', author=None)
+        return self._response  # Followups sent with wait=True return the message
+
+    async def original_response(self):
+        await self.http.request('GET /webhooks/{application.id}/{interaction.token}/messages/@original')
+        return self._response
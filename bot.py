@@ -1,7 +1,9 @@
 import asyncio
 import logging
+import signal
 from sys import exit
 
+import aiohttp
 import discord
 from discord.ext import commands
 
@@ -15,26 +17,84 @@ except ImportError:
     logging.critical('[Bot] config.py does not exist, you should make one from the example config')
     exit(1)
 
+import cogs.metrics as metrics
+import cogs.tracing as tracing
+import cogs.watchdog as watchdog
+
 
 class Parakarry(commands.Bot):
     def __init__(self):
+        intents = discord.Intents(
+            guilds=True, members=True, moderation=True, messages=True, message_content=True, dm_typing=True
+        )
+        cacheProfile = getattr(config, 'cacheProfile', 'lean')
+        if cacheProfile == 'lean':
+            # Mail resolves the few members it needs on demand, the members intent is only kept for join/leave events
+            memberCache = discord.MemberCacheFlags.none()
+            chunkGuilds = False
+
+        elif cacheProfile == 'full':
+            memberCache = discord.MemberCacheFlags.from_intents(intents)
+            chunkGuilds = True
+
+        else:
+            raise ValueError(f'Unknown cacheProfile {cacheProfile!r}, expected \'lean\' or \'full\'')
+
         super().__init__(
             activity=discord.Activity(type=discord.ActivityType.playing, name='DM to contact mods'),
             case_insensitive=True,
             command_prefix=commands.when_mentioned,
-            intents=discord.Intents(
-                guilds=True, members=True, moderation=True, messages=True, message_content=True, dm_typing=True
-            ),
+            intents=intents,
+            member_cache_flags=memberCache,
+            chunk_guilds_at_startup=chunkGuilds,
+            max_messages=getattr(
+                config, 'messageCacheSize', 5000
+            ),  # Reported messages' reply chains are read from here
+            http_trace=self._http_trace(),
         )
+        logging.info(f'[Bot] Using the {cacheProfile} cache profile')
         self.guildList = [config.guild]
         self.remove_command('help')
+        watchdogThreshold = getattr(config, 'loopWatchdogThreshold', 0.5)
+        self.loopWatchdog = watchdog.LoopWatchdog(watchdogThreshold) if watchdogThreshold else None
 
     async def setup_hook(self):
         await self.load_extension('jishaku')
+        # Loaded before the gateway connects so Mail can warm up in parallel with it, on_ready also
+        # fires on every reconnect
+        await self.load_extension('cogs.modmail')
+        if self.loopWatchdog:
+            self.loopWatchdog.start()
+
+        if metrics.enabled:
+            await metrics.start(self)
+
+    async def close(self):
+        if self.loopWatchdog:
+            self.loopWatchdog.stop()
+
+        await metrics.stop()
+        await super().close()
+
+    @staticmethod
+    def _http_trace():
+        trace = aiohttp.TraceConfig()
+        tracing.trace_requests(trace)
+        metrics.trace_requests(trace)
+        return trace if trace.on_request_end else None  # Nothing to record, keep discord.py's session untraced
 
     async def on_ready(self):
         logging.info(f'Parakarry ModMail Bot - Now Logged in as {self.user} ({self.user.id})')
-        await self.load_extension('cogs.modmail')
 
 
-asyncio.run(Parakarry().start(config.token))
+async def main():
+    async with Parakarry() as bot:
+        # docker stop and deploys send SIGTERM, close the bot so cogs flush and unload before the process exits
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            loop.add_signal_handler(sig, lambda: loop.create_task(bot.close()))
+
+        await bot.start(config.token)
+
+
+asyncio.run(main())
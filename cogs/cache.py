@@ -0,0 +1,138 @@
+import asyncio
+import time
+from collections import OrderedDict
+
+MISSING = object()
+
+
+class TTLCache:
+    """
+    Bounded least-recently-used cache whose entries also expire after a fixed time to live.
+    None is a valid cached value, use MISSING as the default to tell a cached None from a miss
+
+    maxsize: int, entries kept before the least recently used is evicted
+    ttl: float, seconds an entry stays valid
+    """
+
+    def __init__(self, maxsize=1024, ttl=60.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()  # key -> (expires at, value)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self.get(key, MISSING) is not MISSING
+
+    def get(self, key, default=None):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+
+            self.misses += 1
+            return default
+
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def set(self, key, value, ttl=None):
+        self._entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+
+class RateGate:
+    """
+    Lets at most one event per key through every `window` seconds, suppressing the rest
+
+    window: float, seconds after a passed event during which the same key is suppressed
+    """
+
+    def __init__(self, window=9.0):
+        self.window = window
+        self.passed = 0
+        self.suppressed = 0
+        self._last = OrderedDict()  # key -> monotonic time of the last passed event, oldest first
+
+    def allow(self, key):
+        now = time.monotonic()
+        last = self._last.get(key)
+        if last is not None and now - last < self.window:
+            self.suppressed += 1
+            return False
+
+        self._last[key] = now
+        self._last.move_to_end(key)
+        while self._last and next(iter(self._last.values())) <= now - self.window:
+            self._last.popitem(last=False)
+
+        self.passed += 1
+        return True
+
+
+class BatchLoader:
+    """
+    Collects the keys requested within `window` seconds of each other and loads them with one call to
+    `load_many`, which takes a list of keys and returns a dict of key -> value. Keys missing from the
+    result load as None
+
+    load_many: coroutine function loading a list of keys
+    window: float, seconds to wait for more keys after the first one of a batch
+    maxsize: int, keys in a batch before it is loaded without waiting out the window
+    """
+
+    def __init__(self, load_many, window=0.05, maxsize=500):
+        self.load_many = load_many
+        self.window = window
+        self.maxsize = maxsize
+        self.batches = 0
+        self._pending = {}  # key -> future of the batch being collected
+        self._timer = None
+
+    async def load(self, key):
+        future = self._pending.get(key)
+        if future is None:
+            future = self._pending[key] = asyncio.get_running_loop().create_future()
+            if len(self._pending) >= self.maxsize:
+                self._dispatch()
+
+            elif self._timer is None:
+                self._timer = asyncio.get_running_loop().call_later(self.window, self._dispatch)
+
+        return await asyncio.shield(future)  # Other callers may be waiting on the same key
+
+    def _dispatch(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+        batch, self._pending = self._pending, {}
+        self.batches += 1
+        asyncio.ensure_future(self._load(batch))
+
+    async def _load(self, batch: dict):
+        try:
+            results = await self.load_many(list(batch))
+
+        except Exception as e:
+            for future in batch.values():
+                if not future.done():
+                    future.set_exception(e)
+
+            return
+
+        for key, future in batch.items():
+            if not future.done():
+                future.set_result(results.get(key))
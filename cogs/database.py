@@ -0,0 +1,70 @@
+import logging
+
+import config
+import pymongo
+from pymongo.asynchronous.collection import AsyncCollection
+
+import cogs.metrics as metrics
+import cogs.tracing as tracing
+
+clientDefaults = {
+    'maxPoolSize': 50,
+    'minPoolSize': 0,
+    'maxIdleTimeMS': 300000,
+    'connectTimeoutMS': 10000,
+    'serverSelectionTimeoutMS': 15000,
+    'retryWrites': True,
+}
+
+_client: pymongo.AsyncMongoClient | None = None
+
+
+def client() -> pymongo.AsyncMongoClient:
+    """
+    Returns the shared Mongo client, creating it on first use so its connection pool and
+    monitors start inside the running event loop. Options in config.mongoOptions override clientDefaults
+    """
+    global _client
+    if _client is None:
+        options = {**clientDefaults, **getattr(config, 'mongoOptions', {})}
+        listeners = list(options.get('event_listeners', []))
+        if tracing.enabled:
+            listeners.append(tracing.CommandTracer())
+
+        if metrics.enabled:
+            listeners.append(metrics.CommandMetrics())
+
+        if listeners:
+            options['event_listeners'] = listeners
+
+        _client = pymongo.AsyncMongoClient(config.mongoURI, **options)
+        logging.info(f'[Database] Created Mongo client with a pool of up to {options["maxPoolSize"]} connections')
+
+    return _client
+
+
+async def close():
+    global _client
+    if _client is not None:
+        await _client.close()
+        _client = None
+
+
+def logs() -> AsyncCollection:
+    return client().modmail.logs
+
+
+def transcripts() -> AsyncCollection:
+    return client().modmail.transcripts
+
+
+def puns() -> AsyncCollection:
+    return client().bowser.puns
+
+
+def users() -> AsyncCollection:
+    return client().bowser.users
+
+
+def messages() -> AsyncCollection:
+    return client().bowser.messages
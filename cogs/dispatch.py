@@ -0,0 +1,95 @@
+import asyncio
+import contextvars
+import time
+from collections import deque
+
+
+class KeyedDispatcher:
+    """
+    Runs work submitted under a key strictly in order per key, with at most `concurrency` keys
+    being worked on at once. Once `maxsize` items are waiting, callers are held at run() until
+    there is room, pushing back on the event source instead of piling up tasks
+
+    handler: coroutine function called with the arguments passed to run()
+    """
+
+    def __init__(self, handler, concurrency=8, maxsize=500):
+        self.handler = handler
+        self.concurrency = concurrency
+        self.maxsize = maxsize
+        self._queues = {}  # key -> deque of (future, args, enqueued at, caller context)
+        self._workers = set()
+        self._slots = asyncio.Semaphore(concurrency)
+        self._capacity = asyncio.Semaphore(maxsize)
+
+        self.depth = 0
+        self.peakDepth = 0
+        self.processed = 0
+        self.throttled = 0
+        self.waitTotal = 0.0
+        self.waitMax = 0.0
+
+    async def run(self, key, *args):
+        """
+        Queues a call to the handler behind any earlier work for the same key and waits for its result
+        """
+        if self._capacity.locked():
+            self.throttled += 1
+
+        await self._capacity.acquire()
+        future = asyncio.get_running_loop().create_future()
+        item = (future, args, time.perf_counter(), contextvars.copy_context())
+        self.depth += 1
+        self.peakDepth = max(self.peakDepth, self.depth)
+
+        queue = self._queues.get(key)
+        if queue is not None:
+            queue.append(item)
+
+        else:
+            self._queues[key] = deque([item])
+            worker = asyncio.create_task(self._drain(key))
+            self._workers.add(worker)
+            worker.add_done_callback(self._workers.discard)
+
+        return await future
+
+    def stats(self):
+        return {
+            'depth': self.depth,
+            'peak_depth': self.peakDepth,
+            'keys': len(self._queues),
+            'processed': self.processed,
+            'throttled': self.throttled,
+            'avg_wait': self.waitTotal / self.processed if self.processed else 0.0,
+            'max_wait': self.waitMax,
+        }
+
+    async def _drain(self, key):
+        queue = self._queues[key]
+        async with self._slots:
+            while queue:
+                # Items stay queued while running so new work for this key is appended, not given a second worker
+                future, args, enqueued, context = queue[0]
+                wait = time.perf_counter() - enqueued
+                self.waitTotal += wait
+                self.waitMax = max(self.waitMax, wait)
+                try:
+                    # Run in the caller's context rather than the worker's, so i.e. tracing spans follow each item
+                    result = await context.run(asyncio.ensure_future, self.handler(*args))
+
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+
+                else:
+                    if not future.done():
+                        future.set_result(result)
+
+                finally:
+                    queue.popleft()
+                    self.depth -= 1
+                    self.processed += 1
+                    self._capacity.release()
+
+        del self._queues[key]
@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import time
+
+import config
+import discord
+
+import cogs.cache as cache
+
+memberTTL = getattr(config, 'memberCacheTTL', 30)
+negativeTTL = getattr(config, 'memberNegativeTTL', 10)  # Seconds a "not in the guild/not banned" answer is kept
+memberCache = cache.TTLCache(getattr(config, 'memberCacheSize', 2048), memberTTL)  # (guild, user) -> Member or None
+banCache = cache.TTLCache(getattr(config, 'memberCacheSize', 2048), memberTTL)  # (guild, user) -> bool
+userCache = cache.TTLCache(getattr(config, 'memberCacheSize', 2048), memberTTL)  # user -> User
+
+_inFlight = {}  # (kind, key) -> task fetching it, concurrent lookups for the same key share one request
+
+
+class BanMirror:
+    """
+    A local copy of one guild's ban list, so ban checks don't need a REST request. Bulk loaded from the API,
+    kept current by ban and unban events and reconciled against the API every `interval` seconds
+
+    guild_id: int, the guild whose bans are mirrored
+    interval: float, seconds between reconciles
+    """
+
+    def __init__(self, guild_id, interval=3600.0):
+        self.guild_id = guild_id
+        self.interval = interval
+        self.loaded = False
+        self._banned = set()
+        self._changes = None  # user -> banned, events seen while a reconcile is paging through the ban list
+        self._task = None
+
+    def __len__(self):
+        return len(self._banned)
+
+    def __contains__(self, user_id):
+        return user_id in self._banned
+
+    def start(self, guild: discord.Guild):
+        if not self._task or self._task.done():
+            self._task = asyncio.create_task(self._run(guild))
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    def update(self, user_id: int, banned: bool):
+        if banned:
+            self._banned.add(user_id)
+
+        else:
+            self._banned.discard(user_id)
+
+        if self._changes is not None:
+            self._changes[user_id] = banned
+
+    async def reconcile(self, guild: discord.Guild):
+        """
+        Replaces the mirror with the guild's current ban list, keeping events that arrived while it was fetched
+        """
+        started = time.perf_counter()
+        self._changes = {}
+        try:
+            banned = {entry.user.id async for entry in guild.bans(limit=None)}
+            for user_id, isBanned in self._changes.items():
+                if isBanned:
+                    banned.add(user_id)
+
+                else:
+                    banned.discard(user_id)
+
+        finally:
+            self._changes = None
+
+        if self.loaded:
+            added, removed = len(banned - self._banned), len(self._banned - banned)
+            if added or removed:
+                logging.warning(f'[Bans] Reconcile found {added} missed bans and {removed} missed unbans')
+
+        else:
+            logging.info(f'[Bans] Mirrored {len(banned)} bans in {time.perf_counter() - started:.2f}s')
+
+        self._banned = banned
+        self.loaded = True
+
+    async def _run(self, guild):
+        while True:
+            try:
+                await self.reconcile(guild)
+
+            except discord.HTTPException as e:
+                logging.error(
+                    f'[Bans] Unable to fetch the ban list, '
+                    f'{"keeping the mirrored list" if self.loaded else "ban checks fall back to REST"}: {e}'
+                )
+
+            await asyncio.sleep(self.interval if self.loaded else 60)  # Retry a failed initial load sooner
+
+
+banMirror = BanMirror(config.guild, getattr(config, 'banReconcileInterval', 3600))
+
+
+async def _single_flight(cacheStore: cache.TTLCache, kind: str, key, fetch, negative=None):
+    """
+    Returns the cached value for key, or fetches it once for every concurrent caller and caches the result.
+    Results equal to `negative` are kept for negativeTTL instead of the cache's own TTL
+    """
+    value = cacheStore.get(key, cache.MISSING)
+    if value is not cache.MISSING:
+        return value
+
+    flightKey = (kind, key)
+    task = _inFlight.get(flightKey)
+    if task is None:
+
+        async def load():
+            value = await fetch()
+            if _inFlight.get(flightKey) is task:  # Not invalidated by an event while the request was out
+                cacheStore.set(key, value, ttl=negativeTTL if value is negative else None)
+
+            return value
+
+        def landed(done):
+            if _inFlight.get(flightKey) is done:
+                del _inFlight[flightKey]
+
+        task = asyncio.ensure_future(load())
+        _inFlight[flightKey] = task
+        task.add_done_callback(landed)
+
+    return await asyncio.shield(task)  # One caller being cancelled must not cancel the shared request
+
+
+async def get_member(guild: discord.Guild, user_id: int) -> discord.Member | None:
+    """
+    Returns a guild member from the gateway cache or a short-lived cache, fetching it from the API on a miss.
+    Most members are not cached with the lean cache profile. Returns None if the user is not in the guild
+    """
+    member = guild.get_member(user_id)
+    if member:
+        return member
+
+    async def fetch():
+        try:
+            return await guild.fetch_member(user_id)
+
+        except discord.NotFound:
+            return None
+
+    return await _single_flight(memberCache, 'member', (guild.id, user_id), fetch)
+
+
+async def is_banned(guild: discord.Guild, user_id: int) -> bool:
+    """
+    Returns whether a user is banned from a guild, from the ban mirror once it has loaded
+    """
+    if guild.id == banMirror.guild_id and banMirror.loaded:
+        return user_id in banMirror
+
+    async def fetch():
+        try:
+            await guild.fetch_ban(discord.Object(id=user_id))
+
+        except discord.NotFound:
+            return False
+
+        return True
+
+    return await _single_flight(banCache, 'ban', (guild.id, user_id), fetch, negative=False)
+
+
+async def get_user(bot, user_id: int) -> discord.User:
+    """
+    Returns a user from the client's cache or a short-lived cache, fetching it from the API on a miss.
+    Raises discord.NotFound for users that don't exist
+    """
+    user = bot.get_user(user_id)
+    if user:
+        return user
+
+    return await _single_flight(userCache, 'user', user_id, lambda: bot.fetch_user(user_id))
+
+
+def _invalidate(kind: str, store: cache.TTLCache, key):
+    store.invalidate(key)
+    _inFlight.pop((kind, key), None)  # A request already out may have been answered before the event
+
+
+def member_joined(member: discord.Member):
+    _invalidate('member', memberCache, (member.guild.id, member.id))
+    memberCache.set((member.guild.id, member.id), member)
+
+
+def member_left(guild_id: int, user_id: int):
+    _invalidate('member', memberCache, (guild_id, user_id))
+    memberCache.set((guild_id, user_id), None, ttl=negativeTTL)
+
+
+def member_banned(guild_id: int, user_id: int):
+    member_left(guild_id, user_id)
+    if guild_id == banMirror.guild_id:
+        banMirror.update(user_id, True)
+
+    _invalidate('ban', banCache, (guild_id, user_id))
+    banCache.set((guild_id, user_id), True)
+
+
+def member_unbanned(guild_id: int, user_id: int):
+    if guild_id == banMirror.guild_id:
+        banMirror.update(user_id, False)
+
+    _invalidate('ban', banCache, (guild_id, user_id))
+    banCache.set((guild_id, user_id), False, ttl=negativeTTL)
@@ -0,0 +1,252 @@
+import asyncio
+import logging
+import math
+import time
+
+import aiohttp
+import config
+from aiohttp import web
+from pymongo import monitoring
+
+import cogs.tracing as tracing
+
+enabled = getattr(config, 'metricsPort', None) is not None
+latencyBuckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+registry = []
+
+_runner = None
+_lagTask = None
+
+
+class Metric:
+    """
+    A named family of samples in the Prometheus text format, one sample per combination of label values
+    """
+
+    kind = 'untyped'
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}  # label values -> value
+        registry.append(self)
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(str(labels[label]) for label in self.labels)
+
+    def _label_text(self, key: tuple, extra: str = '') -> str:
+        pairs = [f'{label}="{_escape(value)}"' for label, value in zip(self.labels, key)]
+        if extra:
+            pairs.append(extra)
+
+        return '{' + ','.join(pairs) + '}' if pairs else ''
+
+    def samples(self):
+        for key, value in self._values.items():
+            yield f'{self.name}{self._label_text(key)} {_format(value)}'
+
+    def render(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} {self.kind}'
+        yield from self.samples()
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        super().__init__(name, help, labels)
+        if not labels:
+            self._values[()] = 0  # Export unlabeled counters from the start so rates work from the first scrape
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """
+    A value that can go up and down. Gauges set with set_function are sampled when scraped
+    """
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        super().__init__(name, help, labels)
+        self._function = None
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def set_function(self, function):
+        self._function = function
+
+    def samples(self):
+        if self._function:
+            yield f'{self.name} {_format(self._function())}'
+
+        else:
+            yield from super().samples()
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: tuple = (), buckets: tuple = latencyBuckets):
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        entry = self._values.get(key)
+        if entry is None:
+            entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]  # Bucket counts, sum, count
+
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                entry[0][i] += 1
+                break
+
+        entry[1] += value
+        entry[2] += 1
+
+    def samples(self):
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucketCount in zip(self.buckets, counts):
+                cumulative += bucketCount
+                le = f'le="{bound}"'
+                yield f'{self.name}_bucket{self._label_text(key, le)} {cumulative}'
+
+            le = 'le="+Inf"'
+            yield f'{self.name}_bucket{self._label_text(key, le)} {count}'
+            yield f'{self.name}_sum{self._label_text(key)} {_format(total)}'
+            yield f'{self.name}_count{self._label_text(key)} {count}'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format(value) -> str:
+    if isinstance(value, float) and not math.isfinite(value):
+        return 'NaN' if math.isnan(value) else ('+Inf' if value > 0 else '-Inf')
+
+    return str(value)
+
+
+dmsReceived = Counter('parakarry_dms_received_total', 'Direct messages received from users')
+dmsForwarded = Counter('parakarry_dms_forwarded_total', 'Direct messages forwarded to a modmail thread')
+threadsOpened = Counter('parakarry_threads_opened_total', 'Modmail threads opened', ('type',))
+threadsClosed = Counter('parakarry_threads_closed_total', 'Modmail threads closed', ('type',))
+pendingCloses = Gauge('parakarry_scheduled_closes', 'Thread closes scheduled and not yet due')
+dmQueueDepth = Gauge('parakarry_dm_queue_depth', 'Direct messages queued or being handled')
+mongoLatency = Histogram('parakarry_mongo_command_seconds', 'Mongo command latency', ('collection', 'command'))
+mongoErrors = Counter('parakarry_mongo_command_errors_total', 'Failed Mongo commands', ('collection', 'command'))
+restLatency = Histogram('parakarry_discord_request_seconds', 'Discord REST request latency', ('method', 'route'))
+restRateLimited = Counter(
+    'parakarry_discord_ratelimited_total', 'Discord REST requests answered with 429', ('method', 'route')
+)
+loopLag = Histogram(
+    'parakarry_event_loop_lag_seconds',
+    'How late the event loop woke a periodic sleep',
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0),
+)
+loopStalls = Counter('parakarry_event_loop_stalls_total', 'Event loop stalls reported by the watchdog', ('handler',))
+outboundQueueDepth = Gauge('parakarry_outbound_queue_depth', 'Outbound messages waiting to be sent', ('priority',))
+outboundQueueTime = Histogram(
+    'parakarry_outbound_queue_seconds', 'Time outbound messages spent queued before sending', ('priority',)
+)
+outboundRetries = Counter(
+    'parakarry_outbound_retries_total', 'Outbound sends retried after a 429 or server error', ('priority',)
+)
+gatewayLatency = Gauge('parakarry_gateway_latency_seconds', 'Latency between a gateway heartbeat and its ack')
+
+
+def render() -> str:
+    return '\n'.join(line for metric in registry for line in metric.render()) + '\n'
+
+
+class CommandMetrics(monitoring.CommandListener):
+    """
+    Records Mongo command latency by collection and command. Registered on the shared
+    client by cogs.database when the metrics endpoint is enabled
+    """
+
+    def __init__(self):
+        self._collections = {}  # (connection, request id) -> namespace
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        collection = event.command.get(event.command_name)
+        namespace = f'{event.database_name}.{collection}' if isinstance(collection, str) else event.database_name
+        self._collections[(event.connection_id, event.request_id)] = namespace
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        namespace = self._collections.pop((event.connection_id, event.request_id), event.database_name)
+        mongoLatency.observe(event.duration_micros / 1000000, collection=namespace, command=event.command_name)
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        namespace = self._collections.pop((event.connection_id, event.request_id), event.database_name)
+        mongoLatency.observe(event.duration_micros / 1000000, collection=namespace, command=event.command_name)
+        mongoErrors.inc(collection=namespace, command=event.command_name)
+
+
+def trace_requests(trace: aiohttp.TraceConfig):
+    """
+    Adds Discord REST latency and rate limit recording to discord.py's HTTP trace config
+    """
+    if not enabled:
+        return
+
+    async def on_request_start(session, context, params):
+        context.metricsStarted = time.perf_counter()
+
+    async def on_request_end(session, context, params):
+        route = tracing.route_name(params.url)
+        restLatency.observe(time.perf_counter() - context.metricsStarted, method=params.method, route=route)
+        if params.response.status == 429:
+            restRateLimited.inc(method=params.method, route=route)
+
+    trace.on_request_start.append(on_request_start)
+    trace.on_request_end.append(on_request_end)
+
+
+async def start(bot):
+    """
+    Serves the registry at /metrics on config.metricsPort and starts sampling event loop lag
+    """
+    global _runner, _lagTask
+    gatewayLatency.set_function(lambda: bot.latency)
+
+    app = web.Application()
+    app.router.add_get('/metrics', _handle_metrics)
+    _runner = web.AppRunner(app, access_log=None)
+    await _runner.setup()
+    host = getattr(config, 'metricsHost', '127.0.0.1')
+    await web.TCPSite(_runner, host, config.metricsPort).start()
+    _lagTask = asyncio.create_task(_sample_loop_lag())
+    logging.info(f'[Metrics] Serving metrics on http://{host}:{config.metricsPort}/metrics')
+
+
+async def stop():
+    global _runner, _lagTask
+    if _lagTask:
+        _lagTask.cancel()
+        _lagTask = None
+
+    if _runner:
+        await _runner.cleanup()
+        _runner = None
+
+
+async def _handle_metrics(request):
+    return web.Response(text=render(), headers={'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'})
+
+
+async def _sample_loop_lag(interval=1.0):
+    loop = asyncio.get_running_loop()
+    while True:
+        started = loop.time()
+        await asyncio.sleep(interval)
+        loopLag.observe(max(0.0, loop.time() - started - interval))
@@ -1,6 +1,6 @@
 import asyncio
+import collections
 import logging
-import re
 import time
 import typing
 import uuid
@@ -8,11 +8,21 @@ from code import interact
 from datetime import datetime, timedelta, timezone
 from sys import exit
 
+import aiohttp
 import discord
-import pymongo
 from discord import app_commands
 from discord.ext import commands
 
+import cogs.cache as cache
+import cogs.database as database
+import cogs.dispatch as dispatch
+import cogs.members as members
+import cogs.metrics as metrics
+import cogs.outbound as outbound
+import cogs.relay as relay
+import cogs.render as render
+import cogs.scheduler as scheduler
+import cogs.tracing as tracing
 import cogs.utils as utils
 import exceptions
 
@@ -23,26 +33,131 @@ except ImportError:
     logging.critical('[Bot] config.py does not exist, you should make one from the example config')
     exit(1)
 
-mclient = pymongo.AsyncMongoClient(config.mongoURI)
 guildList = [config.guild]
 
 
 class Mail(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.closeQueue = {}
+        self.closeScheduler = scheduler.closeScheduler
+        self.closeScheduler.callback = self._scheduled_close
+        self.userDocWatcher = None
+        self.messageStats = collections.Counter()
+        self.typingGate = cache.RateGate(getattr(config, 'typingWindow', 9.0))
+        self.attachmentRelay = relay.AttachmentRelay(getattr(config, 'attachmentSizeLimit', 10 * 1024 * 1024))
+        self.dmDispatcher = dispatch.KeyedDispatcher(
+            self._user_create_thread,
+            concurrency=getattr(config, 'dmWorkers', 8),
+            maxsize=getattr(config, 'dmQueueSize', 500),
+        )
 
-        self.leadModRole = self.bot.get_guild(config.guild).get_role(config.leadModRole)
+        self.ready = asyncio.Event()  # Set once startup has finished, DMs wait on it
+        self.startupTask = None
+        self.startupChecks = None
 
         self.openContextMenu = app_commands.ContextMenu(name='Open a Modmail', callback=self._open_context)
         self.reportContextMenu = app_commands.ContextMenu(name='Report this Message', callback=self._message_report)
         self.bot.tree.add_command(self.openContextMenu, guild=discord.Object(id=config.guild))
         self.bot.tree.add_command(self.reportContextMenu, guild=discord.Object(id=config.guild))
 
+    @property
+    def leadModRole(self):
+        # Resolved when used, the cog is loaded before the gateway has delivered any guilds
+        return self.bot.get_guild(config.guild).get_role(config.leadModRole)
+
+    async def cog_load(self):
+        metrics.pendingCloses.set_function(lambda: len(self.closeScheduler))
+        metrics.dmQueueDepth.set_function(lambda: self.dmDispatcher.depth)
+        self.startupTask = asyncio.create_task(self._startup())
+
+    async def _startup(self):
+        """
+        Warms up everything DM handling needs while the gateway connects, logging how long each stage took.
+        Stages that don't depend on each other run in parallel
+        """
+        timings = {}
+
+        async def warm_up():
+            await _timed('mongo connection', database.client().admin.command('ping'), timings)
+            # Diagnostics only, readiness doesn't wait on them and they can't fail startup
+            self.startupChecks = asyncio.create_task(self._startup_checks())
+            await asyncio.gather(
+                _timed('open threads', utils.openThreads.load(), timings),
+                _timed('pending closes', self.closeScheduler.load(), timings),
+            )
+
+        started = time.perf_counter()
+        try:
+            await asyncio.gather(warm_up(), _timed('gateway', self.bot.wait_until_ready(), timings))
+
+        except Exception:
+            logging.critical('[Startup] Modmail failed to start, shutting down', exc_info=True)
+            return await self.bot.close()  # cog_unload leaves this task running so the close can finish
+
+        logging.info(f'[Modmail] Loaded {len(utils.openThreads)} open threads into the thread index')
+        logging.info(f'[Modmail] Loaded {len(self.closeScheduler)} pending scheduled thread closes')
+        self.closeScheduler.start()
+        members.banMirror.start(self.bot.get_guild(config.guild))  # Ban checks use REST until the mirror has loaded
+        if getattr(config, 'userCacheChangeStream', False):
+            self.userDocWatcher = asyncio.create_task(utils._watch_user_docs())
+
+        self.ready.set()
+        slowest = max(timings, key=timings.get)
+        logging.info(
+            f'[Startup] Modmail ready in {time.perf_counter() - started:.2f}s, slowest stage was {slowest} ({timings[slowest]:.2f}s)'
+        )
+
+    async def _startup_checks(self):
+        checks = {'indexes': utils._ensure_indexes(), 'forum tags': self._check_forum_tags()}
+        results = await asyncio.gather(
+            *(_timed(name, check, {}) for name, check in checks.items()), return_exceptions=True
+        )
+        for name, result in zip(checks, results):
+            if isinstance(result, Exception):
+                logging.warning(f'[Startup] The {name} check failed: {result!r}')
+
+    async def _check_forum_tags(self):
+        forum = await self.bot.fetch_channel(config.forumChannel)  # REST, the guild isn't cached until the gateway is
+        availableTags = {tag.id for tag in forum.available_tags}
+        for threadType, tagID in utils.tagIDS.items():
+            if tagID not in availableTags:
+                logging.warning(f'[Startup] Forum tag {tagID} for {threadType} threads does not exist in {forum}')
+
+    async def interaction_check(self, interaction: discord.Interaction):
+        if not self.ready.is_set():
+            try:
+                await asyncio.wait_for(self.ready.wait(), 2)  # Stay well inside the 3 second response window
+
+            except asyncio.TimeoutError:
+                await interaction.response.send_message(
+                    ':x: Modmail is still starting up, try again in a few seconds', ephemeral=True
+                )
+                return False
+
+        return True
+
+    async def cog_unload(self):
+        # A failed startup closes the bot from its own task, cancelling it would abort that close partway
+        if self.startupTask and self.startupTask is not asyncio.current_task():
+            self.startupTask.cancel()
+
+        if self.startupChecks:
+            self.startupChecks.cancel()
+
+        self.closeScheduler.stop()
+        members.banMirror.stop()
+        if self.userDocWatcher:
+            self.userDocWatcher.cancel()
+
+        await self.attachmentRelay.close()
+        await utils.transcriptWriter.close()
+        await database.close()
+
     @app_commands.command(name='close', description='Closes a modmail thread, optionally with a delay')
     @app_commands.describe(delay='The delay for the modmail to close, in 1w2d3h4m5s format')
     @app_commands.guilds(discord.Object(id=config.guild))
     @app_commands.default_permissions(view_audit_log=True)
+    @tracing.traced
     async def _close(self, interaction: discord.Interaction, delay: typing.Optional[str]):
         await interaction.response.defer()
 
@@ -72,41 +187,57 @@ class Mail(commands.Cog):
             )
 
     async def _close_generic(self, user, guild, channel, delay):
-        db = mclient.modmail.logs
-        doc = await db.find_one({'channel_id': str(channel.id), 'open': True})
+        doc = await utils._get_thread(channel.id, open_only=True)
 
         if not doc:
             raise exceptions.NotAModmail
 
-        if doc['_id'] in self.closeQueue:
-            self.closeQueue[doc['_id']].cancel()
+        await self.closeScheduler.cancel(doc.id)
 
-        if doc['ban_appeal']:
+        if doc.ban_appeal:
             raise exceptions.InvalidType
 
         if delay:
             try:
                 delayDate = utils.resolve_duration(delay)
-                delayTime = delayDate.timestamp() - datetime.now(tz=timezone.utc).timestamp()
 
             except KeyError:
                 raise exceptions.InvalidDuration
 
-            event_loop = self.bot.loop
-            close_action = event_loop.call_later(
-                delayTime,
-                event_loop.create_task,
-                utils._close_thread(self.bot, user, guild, channel, self.bot.get_channel(config.modLog)),
-            )
-            self.closeQueue[doc['_id']] = close_action
+            if not delayDate:
+                raise exceptions.InvalidDuration  # Permanent durations have no close time
+
+            await self.closeScheduler.schedule(doc.id, delayDate, user.id)
             return f'<t:{int(delayDate.timestamp())}:R>'
 
         else:
             await utils._close_thread(self.bot, user, guild, channel, self.bot.get_channel(config.modLog))
 
+    async def _scheduled_close(self, thread_id, closer_id):
+        thread = utils.openThreads.get(thread_id)
+        if not thread:
+            return  # Thread was closed by other means before the scheduled close came due
+
+        try:
+            channel = self.bot.get_channel(thread.channel_id) or await self.bot.fetch_channel(thread.channel_id)
+
+        except (discord.NotFound, discord.Forbidden) as e:
+            # Channel is bad. Force thread closure in the database only
+            logging.warning(f'Received {e} while running scheduled close of thread {thread.channel_id}, recovering')
+            await database.logs().update_one({'_id': thread_id}, {'$set': {'open': False}})
+            utils.openThreads.remove(thread_id)
+            return
+
+        closer = await members.get_user(self.bot, int(closer_id))
+        await utils._close_thread(
+            self.bot, closer, self.bot.get_guild(config.guild), channel, self.bot.get_channel(config.modLog)
+        )
+
     @app_commands.command(name='reply', description='Replys to a modmail, with your username')
     @app_commands.describe(content='The message to send to the user')
     @app_commands.describe(attachment='An image or file to send to the user')
+    @app_commands.describe(attachment2='Another image or file to send to the user')
+    @app_commands.describe(attachment3='Another image or file to send to the user')
     @app_commands.guilds(discord.Object(id=config.guild))
     @app_commands.default_permissions(view_audit_log=True)
     async def _reply_user(
@@ -114,12 +245,16 @@ class Mail(commands.Cog):
         interaction: discord.Interaction,
         content: app_commands.Range[str, None, 1800],
         attachment: typing.Optional[discord.Attachment],
+        attachment2: typing.Optional[discord.Attachment],
+        attachment3: typing.Optional[discord.Attachment],
     ):
-        await self._reply(interaction, content, attachment)
+        await self._reply(interaction, content, [x for x in (attachment, attachment2, attachment3) if x])
 
     @app_commands.command(name='areply', description='Replys to a modmail, anonymously')
     @app_commands.describe(content='The message to send to the user')
     @app_commands.describe(attachment='An image or file to send to the user')
+    @app_commands.describe(attachment2='Another image or file to send to the user')
+    @app_commands.describe(attachment3='Another image or file to send to the user')
     @app_commands.guilds(discord.Object(id=config.guild))
     @app_commands.default_permissions(view_audit_log=True)
     async def _reply_anon(
@@ -127,48 +262,47 @@ class Mail(commands.Cog):
         interaction: discord.Interaction,
         content: app_commands.Range[str, None, 1800],
         attachment: typing.Optional[discord.Attachment],
+        attachment2: typing.Optional[discord.Attachment],
+        attachment3: typing.Optional[discord.Attachment],
     ):
-        await self._reply(interaction, content, attachment, True)
+        await self._reply(interaction, content, [x for x in (attachment, attachment2, attachment3) if x], True)
 
-    async def _reply(self, interaction: discord.Interaction, content, attachment, anonymous=False):
-        db = mclient.modmail.logs
-        doc = await db.find_one({'channel_id': str(interaction.channel.id)})
+    @tracing.traced
+    async def _reply(self, interaction: discord.Interaction, content, attachments: list, anonymous=False):
+        # Deferred before anything else, the member lookup and the queued DM can outlast the 3 second response window
+        await interaction.response.defer()
+        respond = interaction.followup.send
+        doc = await utils._get_thread(interaction.channel.id)
 
         if (
             interaction.channel.category_id != config.category or not doc
         ):  # No thread in channel, or not in modmail category
-            return await interaction.response.send_message(
-                'Cannot send a reply here, this is not a modmail channel!', ephemeral=True
+            return await respond('Cannot send a reply here, this is not a modmail channel!', ephemeral=True)
+
+        if await self.closeScheduler.cancel(doc.id):  # Thread close was scheduled, cancel due to response
+            await outbound.send(
+                interaction.channel,
+                outbound.THREAD,
+                'Thread closure has been canceled because a moderator has sent a message',
             )
 
-        if attachment:
-            await interaction.response.defer()
+        recipient = doc.recipient_id
+        try:
+            member = await members.get_member(interaction.guild, recipient) or await members.get_member(
+                self.bot.get_guild(config.appealGuild), recipient
+            )
 
-        if doc['_id'] in self.closeQueue.keys():  # Thread close was scheduled, cancel due to response
-            self.closeQueue[doc['_id']].cancel()
-            self.closeQueue.pop(doc['_id'], None)
-            await interaction.channel.send('Thread closure has been canceled because a moderator has sent a message')
+        except discord.HTTPException:
+            member = None
 
-        recipient = doc['recipient']['id']
-        member = interaction.guild.get_member(recipient)
         if not member:
-            try:
-                member = await interaction.guild.fetch_member(recipient)
-
-            except:
-                try:
-                    member = await self.bot.get_guild(config.appealGuild).fetch_member(recipient)
-
-                except:
-                    return await interaction.response.send_message(
-                        'There was an issue replying to this user, they may have left the server'
-                    )
+            return await respond('There was an issue replying to this user, they may have left the server')
 
         try:
             if anonymous:
                 responsibleModerator = 'a **Moderator**'
 
-            elif interaction.guild.owner == interaction.user:
+            elif interaction.guild.owner_id == interaction.user.id:
                 responsibleModerator = f'*(Server Owner)* **{interaction.user}**'
 
             elif self.leadModRole in interaction.user.roles:
@@ -179,17 +313,27 @@ class Mail(commands.Cog):
 
             replyText = f'Reply from {responsibleModerator}: {content if content else ""}'
 
-            if attachment:
-                replyMessage = await member.send(replyText, file=await attachment.to_file())
+            if attachments:
+                async with self.attachmentRelay.files(attachments) as files:
+                    replyMessage = await outbound.send(member, outbound.USER, replyText, files=files)
 
             else:
-                replyMessage = await member.send(replyText)
+                replyMessage = await outbound.send(member, outbound.USER, replyText)
 
         except discord.errors.Forbidden:
-            return await interaction.response.send_message(
+            return await respond(
                 'There was an issue replying to this user, they may have left the server or disabled DMs'
             )
 
+        except exceptions.AttachmentTooLarge as e:
+            return await respond(
+                f':x: Unable to send `{e}`, attachments cannot be larger than {self.attachmentRelay.max_size // 1024 // 1024} MB'
+            )
+
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:  # The relay's total timeout isn't a ClientError
+            logging.error(f'Failed to download reply attachments: {e!r}')
+            return await respond(':x: Failed to download one or more attachments, no reply has been sent')
+
         embed = discord.Embed(title='Moderator message', description=content, color=0x7ED321)
         if not anonymous:
             embed.set_author(
@@ -203,42 +347,34 @@ class Mail(commands.Cog):
                 icon_url='https://cdn.mattbsg.xyz/rns/snoo.png',
             )
 
-        if attachment and re.search(
-            r'\.(gif|jpe?g|tiff|png|webp)(\?[a-zA-Z0-9#-_]*)?$', str(attachment), re.IGNORECASE
-        ):  # One attachment, image
-            embed.set_image(url=replyMessage.attachments[0].url)
+        sentAttachments = [x.url for x in replyMessage.attachments]
+        if len(sentAttachments) > 1:  # More than one attachment, use fields
+            for x in range(len(sentAttachments)):
+                embed.add_field(name=f'Attachment {x + 1}', value=sentAttachments[x])
 
-        elif attachment:  # Still have an attachment, but not an image
-            embed.add_field(name=f'Attachment', value=replyMessage.attachments[0].url)
+        elif sentAttachments and render.is_image(sentAttachments[0]):  # One attachment, image
+            embed.set_image(url=sentAttachments[0])
 
-        if not attachment:
-            await interaction.response.send_message(embed=embed)
+        elif sentAttachments:  # Still have an attachment, but not an image
+            embed.add_field(name=f'Attachment', value=sentAttachments[0])
 
-        else:
-            await interaction.followup.send(embed=embed)
-        mailMsg = await interaction.original_response()
+        mailMsg = await respond(embed=embed, wait=True)
 
-        await db.update_one(
-            {'_id': doc['_id']},
+        utils._append_message(
+            doc.id,
             {
-                '$push': {
-                    'messages': {
-                        'timestamp': str(datetime.now(tz=timezone.utc).isoformat(sep=' ')),
-                        'message_id': str(mailMsg.id),
-                        'content': content if content else '',
-                        'type': 'thread_message' if not anonymous else 'anonymous',
-                        'author': {
-                            'id': str(interaction.user.id),
-                            'name': interaction.user.name,
-                            'discriminator': interaction.user.discriminator,
-                            'avatar_url': str(
-                                interaction.user.display_avatar.with_static_format('png').with_size(1024)
-                            ),
-                            'mod': True,
-                        },
-                        'attachments': [replyMessage.attachments[0].url] if replyMessage.attachments else [],
-                    }
-                }
+                'timestamp': str(datetime.now(tz=timezone.utc).isoformat(sep=' ')),
+                'message_id': str(mailMsg.id),
+                'content': content if content else '',
+                'type': 'thread_message' if not anonymous else 'anonymous',
+                'author': {
+                    'id': str(interaction.user.id),
+                    'name': interaction.user.name,
+                    'discriminator': interaction.user.discriminator,
+                    'avatar_url': str(interaction.user.display_avatar.with_static_format('png').with_size(1024)),
+                    'mod': True,
+                },
+                'attachments': sentAttachments,
             },
         )
 
@@ -260,8 +396,10 @@ class Mail(commands.Cog):
         """
 
         await interaction.response.defer()
+        await self.ready.wait()  # Context menus aren't covered by the cog's interaction_check
         await self._open_thread(interaction, member)
 
+    @tracing.traced
     async def _open_thread(self, interaction: discord.Interaction, member: discord.Member):
         """
         Open a modmail thread with a user
@@ -270,24 +408,24 @@ class Mail(commands.Cog):
         if member.bot:
             return await interaction.followup.send(':x: Modmail threads cannot be opened with bot accounts')
 
-        open_thread = await mclient.modmail.logs.find_one({'recipient.id': str(member.id), 'open': True})
+        open_thread = utils.openThreads.by_recipient(member.id)
         if open_thread:
             # Check thread channel exists
-            if not self.bot.get_channel(int(open_thread['channel_id'])):
+            if not self.bot.get_channel(open_thread.channel_id):
                 # Thread channel not found in cache, attempt to API pull and recover
                 try:
-                    await self.bot.fetch_channel(int(open_thread['channel_id']))
+                    await self.bot.fetch_channel(open_thread.channel_id)
 
                 except (discord.NotFound, discord.Forbidden) as e:
                     # Channel is bad. Force thread closure and create anew
-                    logging.warning(f'Received {e} while checking thread {open_thread["channel_id"]}, recovering')
-                    await mclient.modmail.logs.update_one(
-                        {'channel_id': open_thread['channel_id']}, {'$set': {'open': False}}
-                    )
+                    logging.warning(f'Received {e} while checking thread {open_thread.channel_id}, recovering')
+                    await self.closeScheduler.cancel(open_thread.id)
+                    await database.logs().update_one({'_id': open_thread.id}, {'$set': {'open': False}})
+                    utils.openThreads.remove(open_thread.id)
 
                 else:
                     return await interaction.followup.send(
-                        f':x: Unable to open modmail to user -- there is already a thread involving them currently open in <#{open_thread["channel_id"]}>'
+                        f':x: Unable to open modmail to user -- there is already a thread involving them currently open in <#{open_thread.channel_id}>'
                     )
 
         try:
@@ -305,8 +443,10 @@ class Mail(commands.Cog):
         if message.author.bot:
             return await interaction.followup.send(':x: You cannot report messages sent by bots', ephemeral=True)
 
+        await self.ready.wait()  # Deferred, so a report made during startup can wait for it
+
         try:
-            dmOpened = await self._user_create_thread(message, interaction, menu_interacted=True)
+            dmOpened = await self.dmDispatcher.run(interaction.user.id, message, interaction, True)
 
         except exceptions.ModmailBlacklisted:
             return await interaction.followup.send(
@@ -339,18 +479,18 @@ class Mail(commands.Cog):
 
     @appeal_group.command(name='accept', description='Accept a user\'s ban appeal')
     @app_commands.describe(reason='Why are you accepting this appeal?')
+    @tracing.traced
     async def _appeal_accept(self, interaction: discord.Interaction, reason: app_commands.Range[str, None, 990]):
-        db = mclient.modmail.logs
-        punsDB = mclient.bowser.puns
-        userDB = mclient.bowser.users
+        punsDB = database.puns()
+        userDB = database.users()
 
-        doc = await db.find_one({'channel_id': str(interaction.channel.id), 'open': True, 'ban_appeal': True})
+        doc = await utils._get_thread(interaction.channel.id, open_only=True, ban_appeal=True)
         if not doc:
             return await interaction.response.send_message(':x: This is not a ban appeal channel!', ephemeral=True)
 
         await interaction.response.defer()
 
-        user = await self.bot.fetch_user(int(doc['recipient']['id']))
+        user = await members.get_user(self.bot, doc.recipient_id)
         await punsDB.update_one({'user': user.id, 'type': 'ban', 'active': True}, {'$set': {'active': False}})
         await punsDB.update_one({'user': user.id, 'type': 'appealdeny', 'active': True}, {'$set': {'active': False}})
         await interaction.guild.unban(user, reason=f'Ban appeal accepted by {interaction.user}')
@@ -378,11 +518,13 @@ class Mail(commands.Cog):
         embed.add_field(name='User', value=user.mention, inline=True)
         embed.add_field(name='Moderator', value=f'{interaction.user.mention}', inline=True)
         embed.add_field(name='Reason', value=reason)
-        await self.bot.get_channel(config.modLog).send(embed=embed)
+        await outbound.send(self.bot.get_channel(config.modLog), outbound.LOG, embed=embed)
 
         try:
-            await user.send(
-                f'The moderators have decided to **lift your ban** on the {interaction.guild} Discord and your ban appeal thread has been closed. We kindly ask that you look over our server rules again upon your return. You may join back with this invite link: https://discord.gg/switch\nIf you are unable to join please try reloading your  Discord client. Still can\'t join? You are likely IP banned on another account and you will need to appeal that ban as well.\n\nReason given by moderators:\n```{reason}```'
+            await outbound.send(
+                user,
+                outbound.USER,
+                f'The moderators have decided to **lift your ban** on the {interaction.guild} Discord and your ban appeal thread has been closed. We kindly ask that you look over our server rules again upon your return. You may join back with this invite link: https://discord.gg/switch\nIf you are unable to join please try reloading your  Discord client. Still can\'t join? You are likely IP banned on another account and you will need to appeal that ban as well.\n\nReason given by moderators:\n```{reason}```',
             )
 
         except:
@@ -406,7 +548,7 @@ class Mail(commands.Cog):
                 reason='[Appeal accepted] ' + reason,
             )
             try:
-                member = await self.bot.get_guild(config.appealGuild).fetch_member(user.id)
+                member = await members.get_member(self.bot.get_guild(config.appealGuild), user.id)
                 await member.kick(reason='Accepted appeal')
 
             except:
@@ -417,19 +559,19 @@ class Mail(commands.Cog):
         next_attempt='The amount of time until the user can appeal again, in 1w2d3h4m5s format. You can also pass \'permanent\'.',
         reason='Why are you denying this appeal?',
     )
+    @tracing.traced
     async def _appeal_deny(
         self, interaction: discord.Interaction, next_attempt: str, reason: app_commands.Range[str, None, 990]
     ):
-        db = mclient.modmail.logs
-        punsDB = mclient.bowser.puns
+        punsDB = database.puns()
 
-        doc = await db.find_one({'channel_id': str(interaction.channel.id), 'open': True, 'ban_appeal': True})
+        doc = await utils._get_thread(interaction.channel.id, open_only=True, ban_appeal=True)
         if not doc:
             return await interaction.response.send_message(':x: This is not a ban appeal channel!', ephemeral=True)
 
         await interaction.response.defer()
 
-        user = await self.bot.fetch_user(int(doc['recipient']['id']))
+        user = await members.get_user(self.bot, doc.recipient_id)
         try:
             delayDate = utils.resolve_duration(next_attempt)
             delayTimestamp = None
@@ -509,11 +651,13 @@ class Mail(commands.Cog):
         embed.add_field(name='Moderator', value=f'{interaction.user.mention}', inline=True)
         embed.add_field(name='Next appeal in', value='Never' if delayDate == None else f'<t:{delayTimestamp}:R>')
         embed.add_field(name='Reason', value=reason)
-        await self.bot.get_channel(config.modLog).send(embed=embed)
+        await outbound.send(self.bot.get_channel(config.modLog), outbound.LOG, embed=embed)
 
         try:
-            await user.send(
-                f'The moderators have decided to **uphold your ban** on the {interaction.guild} Discord and your ban appeal thread has been closed. {durationUserStr}'
+            await outbound.send(
+                user,
+                outbound.USER,
+                f'The moderators have decided to **uphold your ban** on the {interaction.guild} Discord and your ban appeal thread has been closed. {durationUserStr}',
             )
 
         except:
@@ -539,7 +683,7 @@ class Mail(commands.Cog):
                 reason='[Appeal denied] ' + reason,
             )
             try:
-                member = await self.bot.get_guild(config.appealGuild).fetch_member(user.id)
+                member = await members.get_member(self.bot.get_guild(config.appealGuild), user.id)
                 if delayDate:
                     await member.kick(reason='Failed appeal')
 
@@ -549,6 +693,16 @@ class Mail(commands.Cog):
             except:
                 pass
 
+    @commands.command(name='migratetranscripts')
+    @commands.is_owner()
+    async def _migrate_transcripts(self, ctx):
+        if not utils.splitTranscripts:
+            return await ctx.send(':x: Enable `splitTranscripts` in the config before migrating transcripts')
+
+        await ctx.send('Migrating thread transcripts to modmail.transcripts, this may take a while...')
+        threadCnt, messageCnt = await utils._migrate_transcripts()
+        await ctx.send(f':white_check_mark: Migrated {messageCnt} messages from {threadCnt} threads')
+
     @commands.Cog.listener()
     async def on_command_error(self, ctx, error):
         if isinstance(error, commands.errors.CommandNotFound):
@@ -568,59 +722,68 @@ class Mail(commands.Cog):
             raise error
 
     @commands.Cog.listener()
-    async def on_typing(self, channel, user, when):
-        if channel.type == discord.ChannelType.private:
-            db = mclient.modmail.logs
-            doc = await db.find_one({'open': True, 'creator.id': str(user.id)})
-            if doc:
+    async def on_raw_typing(self, payload: discord.RawTypingEvent):
+        # The raw event, on_typing is only dispatched while the user is still in the client's weak user cache
+        if payload.guild_id is None and self.ready.is_set():
+            doc = utils.openThreads.by_creator(payload.user_id)
+            if doc and self.typingGate.allow(doc.id):  # Forward at most one indicator per thread per typing period
                 try:
-                    await self.bot.get_channel(int(doc['channel_id'])).typing()
+                    await self.bot.get_channel(doc.channel_id).typing()
 
                 except AttributeError:
                     logging.error(
-                        f'Failed attempt to forward typing indicator to thread {doc["channel_id"]}, channel does not exist'
+                        f'Failed attempt to forward typing indicator to thread {doc.channel_id}, channel does not exist'
                     )
 
     @commands.Cog.listener()
     async def on_member_ban(self, guild, member):
-        db = mclient.modmail.logs
-        thread = await db.find_one({'recipient.id': str(member.id), 'open': True})
+        members.member_banned(guild.id, member.id)
+        await self.ready.wait()
+        thread = utils.openThreads.by_recipient(member.id)
         if thread:
-            channel = self.bot.get_channel(int(thread['channel_id']))
-            await channel.send(f'**{member}** has been banned from the server and this thread is now closed.')
+            channel = self.bot.get_channel(thread.channel_id)
+            await outbound.send(
+                channel, outbound.THREAD, f'**{member}** has been banned from the server and this thread is now closed.'
+            )
 
-            if not thread['ban_appeal']:
-                await self._close_generic(member, member.guild, channel, None)
+            if not thread.ban_appeal:
+                await self._close_generic(member, guild, channel, None)  # Uncached members arrive as a discord.User
+
+    @commands.Cog.listener()
+    async def on_member_unban(self, guild, user):
+        members.member_unbanned(guild.id, user.id)
 
     @commands.Cog.listener()
     async def on_member_join(self, member):
-        db = mclient.modmail.logs
-        thread = await db.find_one({'recipient.id': str(member.id), 'open': True})
+        utils.invalidate_user_doc(member.id)  # Bowser updates the user document on join
+        members.member_joined(member)
+        await self.ready.wait()
+        thread = utils.openThreads.by_recipient(member.id)
         if thread:  # Check if a thread is open
             if (
-                member.guild.id == config.guild and thread['_id'] in self.closeQueue.keys()
+                member.guild.id == config.guild and thread.id in self.closeScheduler
             ):  # Standard thread and pending closure
-                await self.bot.get_guild(int(thread['guild_id'])).get_channel(int(thread['channel_id'])).send(
-                    f'**{member}** has joined the server, thread closure has been canceled'
+                await outbound.send(
+                    self.bot.get_guild(thread.guild_id).get_channel(thread.channel_id),
+                    outbound.THREAD,
+                    f'**{member}** has joined the server, thread closure has been canceled',
                 )
 
-                self.closeQueue[thread['_id']].cancel()
-                self.closeQueue.pop(thread['_id'], None)
+                await self.closeScheduler.cancel(thread.id)
 
-            elif thread['ban_appeal']:  # Appeals don't have close delays
-                await self.bot.get_guild(int(thread['guild_id'])).get_channel(int(thread['channel_id'])).send(
-                    f'**{member}** has rejoined the appeal server'
+            elif thread.ban_appeal:  # Appeals don't have close delays
+                await outbound.send(
+                    self.bot.get_guild(thread.guild_id).get_channel(thread.channel_id),
+                    outbound.THREAD,
+                    f'**{member}** has rejoined the appeal server',
                 )
 
         if member.guild.id != config.appealGuild:  # Return if guild not the appeal server
             return
 
         guild = self.bot.get_guild(config.guild)
-        try:
-            await guild.fetch_ban(member)
-
-        except discord.errors.NotFound:
-            guildMember = guild.get_member(member.id)
+        if not await members.is_banned(guild, member.id):
+            guildMember = await members.get_member(guild, member.id)
             if guildMember and (
                 guild.get_role(config.modRole) in guildMember.roles
                 or guild.get_role(config.trialModRole) in guildMember.roles
@@ -628,8 +791,10 @@ class Mail(commands.Cog):
                 return
 
             try:
-                await member.send(
-                    'You have been automatically kicked from the /r/NintendoSwitch ban appeal server because you are not currently banned.\n\nDiscord also prevents you from joining if another account was banned from our server with the same IP or phone number as you. If you still can\'t join, you will need to submit an appeal from the other account that was banned.'
+                await outbound.send(
+                    member,
+                    outbound.USER,
+                    'You have been automatically kicked from the /r/NintendoSwitch ban appeal server because you are not currently banned.\n\nDiscord also prevents you from joining if another account was banned from our server with the same IP or phone number as you. If you still can\'t join, you will need to submit an appeal from the other account that was banned.',
                 )
 
             except:
@@ -641,32 +806,50 @@ class Mail(commands.Cog):
         await utils._can_appeal(member)
 
     @commands.Cog.listener()
-    async def on_member_remove(self, member):
+    async def on_raw_member_remove(self, payload: discord.RawMemberRemoveEvent):
+        # The raw event, on_member_remove is only dispatched for members that were in the member cache
+        member = payload.user
+        utils.invalidate_user_doc(member.id)
+        members.member_left(payload.guild_id, member.id)
         await asyncio.sleep(10)  # Wait for ban to pass and thread to close in-case
-        db = mclient.modmail.logs
-        thread = await db.find_one({'recipient.id': str(member.id), 'open': True})
+        await self.ready.wait()
+        thread = utils.openThreads.by_recipient(member.id)
         if thread:
-            channel = await self.bot.fetch_channel(thread['channel_id'])
-
-            if member.guild.id == config.guild:
-                scheduledTime = await self._close_generic(member, member.guild, channel, '4h')
-                await channel.send(f'**{member}** has left the server. Thread scheduled to be closed {scheduledTime}')
+            channel = await self.bot.fetch_channel(thread.channel_id)
+
+            if payload.guild_id == config.guild:
+                scheduledTime = await self._close_generic(member, self.bot.get_guild(payload.guild_id), channel, '4h')
+                await outbound.send(
+                    channel,
+                    outbound.THREAD,
+                    f'**{member}** has left the server. Thread scheduled to be closed {scheduledTime}',
+                )
 
             elif (
-                thread['ban_appeal'] and member.guild.id == config.appealGuild
+                thread.ban_appeal and payload.guild_id == config.appealGuild
             ):  # We only care about appeal leaves if they had an appeal thread
-                await channel.send(f'**{member}** has left the server')
+                await outbound.send(channel, outbound.THREAD, f'**{member}** has left the server')
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
-        if message.author.bot:
+        # Only DMs can open or add to a thread, guild chatter is dropped before any other work is done
+        if message.guild is not None:
+            self.messageStats['ignored_guild'] += 1
             return
 
-        if message.channel.type not in [discord.ChannelType.private, discord.ChannelType.text]:
+        if message.author.bot:
+            self.messageStats['ignored_bot'] += 1
             return
 
+        self.messageStats['dispatched'] += 1
+        metrics.dmsReceived.inc()
+        await self.ready.wait()  # DMs that arrive while starting up are held rather than dropped
         try:
-            await self._user_create_thread(message)
+            # Serialized per user so quick successive DMs can't race each other into duplicate threads
+            with tracing.span('on_message'):  # Traced past the guild filter, guild chatter would drown out DMs
+                await self.dmDispatcher.run(message.author.id, message)
+
+            metrics.dmsForwarded.inc()
 
         except exceptions.InvalidType:
             logging.error(
@@ -674,115 +857,30 @@ class Mail(commands.Cog):
             )
 
         except exceptions.ModmailBlacklisted:
-            return await message.author.send(
+            return await outbound.send(
+                message.author,
+                outbound.USER,
                 'Sorry, I cannot create a new modmail thread because you are currently blacklisted. '
-                'You may DM a moderator if you still need to contact a Discord staff member.'
+                'You may DM a moderator if you still need to contact a Discord staff member.',
             )
 
     def _format_message_embed(
         self, message: discord.Message, attachments: list, interaction: discord.Interaction = None
     ):
-        is_forward = False
-        _original_jump_url = message.jump_url
-        if message.message_snapshots:
-            # Forwarded message
-            # Discord has future capability for recursive snapshot depths, but only one is returned for now
-            message = message.message_snapshots[0]
-            attachments = message.attachments
-            is_forward = True
-
-        if message.content:
-            content = message.content
-
-        elif message.stickers:
-            content = "\n".join([f'*Sent a sticker: {sticker.name}*' for sticker in message.stickers])
-
-        else:
-            content = '*No message content.*'
-
-        embed = discord.Embed(
-            title='Message reported' if interaction else 'New message',
-            description=content,
-            color=0xF381FD if interaction else 0x32B6CE,
-        )
-        if is_forward and message.cached_message:
-            embed.set_author(
-                name=f'Forwarded message from {message.cached_message.author} ({message.cached_message.author.id})',
-                icon_url=message.cached_message.author.display_avatar.url,
-            )
-            if interaction:
-                # Message reports shouldn't traverse through snapshots, jump only to the actual reported message
-                embed.url = _original_jump_url
-
-            else:
-                embed.url = message.cached_message.jump_url
-
-        elif is_forward and not message.cached_message:
-            embed.set_author(name=f'Forwarded message from unknown author')
-
-        else:
-            embed.set_author(name=f'{message.author} ({message.author.id})', icon_url=message.author.display_avatar.url)
-
-        if not interaction:
-            if not is_forward:
-                embed.set_footer(text=f'{message.channel.id}/{message.id}')
-
-            elif is_forward and message.cached_message:
-                embed.set_footer(text=f'{message.cached_message.channel.id}/{message.cached_message.id}')
-
-        elif not is_forward and interaction and message.reference and message.reference.cached_message:
-            reply = message.reference.cached_message
-            embed.url = message.jump_url
-            for index in range(4):  # Resolve 4 message replies
-                if len(reply.content) > 200:
-                    reply_content = reply.content[:200] + ' [...]'
-
-                elif not reply.content:
-                    reply_content = '*sent a sticker*'
-
-                else:
-                    reply_content = reply.content
-
-                embed.add_field(
-                    name=f'⤵  In reply to {reply.author}', value=f'{reply.jump_url}\n{reply_content}', inline=False
-                )
-                if reply.reference and reply.reference.cached_message is not None:
-                    reply = reply.reference.cached_message
-
-                else:  # The message isn't cached or doesn't have any more replies in the chain
-                    break
-
-        elif not is_forward:
-            embed.url = message.jump_url
-
-        if message.stickers:
-            embed.set_image(url=message.stickers[0].url)
-
-        if len(attachments) > 1:  # More than one attachment, use fields
-            for x in range(len(attachments)):
-                embed.add_field(name=f'Attachment {x + 1}', value=attachments[x])
-
-        elif attachments and re.search(
-            r'\.(gif|jpe?g|tiff|png|webp)(\?[a-zA-Z0-9#-_]*)?$', str(attachments[0]), re.IGNORECASE
-        ):  # One attachment, image
-            embed.set_image(url=attachments[0])
-
-        elif attachments:  # Still have an attachment, but not an image
-            embed.add_field(name=f'Attachment', value=attachments[0])
-
-        return content, embed
+        snapshot = render.snapshot_message(message, attachments, report=interaction is not None)
+        content, embed = render.render_message_embed(snapshot, report=interaction is not None)
+        return content, discord.Embed.from_dict(embed)
 
     async def _user_create_thread(
         self, message: discord.Message, interaction: discord.Interaction = None, menu_interacted: bool = False
     ):
         successfulDM = False
-        attachments = [x.url for x in message.attachments]
-        ctx = await self.bot.get_context(message)
-
         if message.type not in [discord.MessageType.default, discord.MessageType.reply]:
             raise exceptions.InvalidType
 
-        db = mclient.modmail.logs
+        attachments = [x.url for x in message.attachments]
+
+        db = database.logs()
 
         async def _create_discord_thread(self, message: discord.Message, interaction: discord.Interaction = None):
             thread, successfulDM = await utils._trigger_create_user_thread(
@@ -798,40 +896,44 @@ class Mail(commands.Cog):
             if not successfulDM:
                 msgContent += '\nPlease note, this user\'s DMs are closed. As such, they have been notified when they reported this message that they may not receive a moderator response.'
 
-            await thread.send(content=msgContent, embed=embed, silent=True)
+            await outbound.send(thread, outbound.THREAD, content=msgContent, embed=embed, silent=True)
 
         # Do something to check category, and add message to log
         if message.channel.type == discord.ChannelType.private or interaction:
             # User has sent a message -- check
             reporter = message.author if not interaction else interaction.user
-            thread = await db.find_one({'recipient.id': str(reporter.id), 'open': True})
+            thread = utils.openThreads.by_recipient(reporter.id)
             if thread:
-                if thread['_id'] in self.closeQueue.keys():  # Thread close was scheduled, cancel due to response
-                    self.closeQueue[thread['_id']].cancel()
-                    self.closeQueue.pop(thread['_id'], None)
-                    await self.bot.get_guild(int(thread['guild_id'])).get_channel(int(thread['channel_id'])).send(
-                        'Thread closure has been canceled because the user has sent a message'
+                if await self.closeScheduler.cancel(thread.id):  # Thread close was scheduled, cancel due to response
+                    await outbound.send(
+                        self.bot.get_guild(thread.guild_id).get_channel(thread.channel_id),
+                        outbound.THREAD,
+                        'Thread closure has been canceled because the user has sent a message',
                     )
 
                 content, embed = self._format_message_embed(message, attachments, interaction=interaction)
-                destination = self.bot.get_channel(int(thread['channel_id']))
+                destination = self.bot.get_channel(thread.channel_id)
                 if not destination:
                     # Thread channel not found in cache, attempt to API pull and recover
                     try:
-                        destination = await self.bot.fetch_channel(int(thread['channel_id']))
+                        destination = await self.bot.fetch_channel(thread.channel_id)
 
                     except (discord.NotFound, discord.Forbidden) as e:
                         # Channel is bad. Force thread closure and create anew
-                        logging.warning(f'Received {e} while adding reply to thread {thread["channel_id"]}, recovering')
-                        await db.update_one({'channel_id': thread['channel_id']}, {'$set': {'open': False}})
+                        logging.warning(f'Received {e} while adding reply to thread {thread.channel_id}, recovering')
+                        await self.closeScheduler.cancel(thread.id)
+                        await db.update_one({'_id': thread.id}, {'$set': {'open': False}})
+                        utils.openThreads.remove(thread.id)
                         await _create_discord_thread(self, message, interaction)
                         if not interaction:
                             await message.add_reaction('✅')
 
                         if successfulDM and interaction:
                             try:
-                                reportConfirm = await interaction.user.send(
-                                    f'*You reported a message from {message.author}: <{message.jump_url}>*'
+                                reportConfirm = await outbound.send(
+                                    interaction.user,
+                                    outbound.USER,
+                                    f'*You reported a message from {message.author}: <{message.jump_url}>*',
                                 )
                                 await reportConfirm.add_reaction('✅')
                             except discord.Forbidden:
@@ -840,28 +942,22 @@ class Mail(commands.Cog):
                         return successfulDM
 
                 successfulDM = True
-                await destination.send(embed=embed)
-                await db.update_one(
-                    {'_id': thread['_id']},
+                await outbound.send(destination, outbound.THREAD, embed=embed)
+                utils._append_message(
+                    thread.id,
                     {
-                        '$push': {
-                            'messages': {
-                                'timestamp': str(message.created_at),
-                                'message_id': str(message.id),
-                                'content': content,
-                                'type': 'report' if interaction else 'thread_message',
-                                'author': {
-                                    'id': str(message.author.id),
-                                    'name': message.author.name,
-                                    'discriminator': message.author.discriminator,
-                                    'avatar_url': str(
-                                        message.author.display_avatar.with_static_format('png').with_size(1024)
-                                    ),
-                                    'mod': False,
-                                },
-                                'attachments': [x.url for x in message.stickers] + attachments,
-                            }
-                        }
+                        'timestamp': str(message.created_at),
+                        'message_id': str(message.id),
+                        'content': content,
+                        'type': 'report' if interaction else 'thread_message',
+                        'author': {
+                            'id': str(message.author.id),
+                            'name': message.author.name,
+                            'discriminator': message.author.discriminator,
+                            'avatar_url': str(message.author.display_avatar.with_static_format('png').with_size(1024)),
+                            'mod': False,
+                        },
+                        'attachments': [x.url for x in message.stickers] + attachments,
                     },
                 )
 
@@ -873,8 +969,10 @@ class Mail(commands.Cog):
 
             if successfulDM and interaction:
                 try:
-                    reportConfirm = await interaction.user.send(
-                        f'*You reported a message from {message.author}: <{message.jump_url}>*'
+                    reportConfirm = await outbound.send(
+                        interaction.user,
+                        outbound.USER,
+                        f'*You reported a message from {message.author}: <{message.jump_url}>*',
                     )
                     await reportConfirm.add_reaction('✅')
                 except discord.Forbidden:
@@ -918,5 +1016,13 @@ class Mail(commands.Cog):
             raise error
 
 
+async def _timed(name, coro, timings: dict):
+    started = time.perf_counter()
+    result = await coro
+    timings[name] = time.perf_counter() - started
+    logging.info(f'[Startup] {name}: {timings[name]:.2f}s')
+    return result
+
+
 async def setup(bot):
     await bot.add_cog(Mail(bot))
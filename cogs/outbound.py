@@ -0,0 +1,187 @@
+import asyncio
+import contextvars
+import heapq
+import itertools
+import logging
+import time
+
+import config
+import discord
+
+import cogs.metrics as metrics
+
+USER = 0  # Replies and notices DMed to users
+THREAD = 1  # Posts forwarded into modmail threads
+LOG = 2  # Mod log embeds and admin alerts
+priorityNames = {USER: 'user', THREAD: 'thread', LOG: 'log'}
+
+
+class PrioritySlots:
+    """
+    A semaphore that hands free slots to the waiter with the lowest priority number first, in order of arrival
+    """
+
+    def __init__(self, size):
+        self._free = size
+        self._waiters = []  # Heap of (priority, arrival, future)
+        self._arrivals = itertools.count()
+
+    async def acquire(self, priority):
+        if self._free and not self._waiters:
+            self._free -= 1
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._arrivals), future))
+        try:
+            await future
+
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():  # Handed a slot just as the waiter was cancelled
+                self.release()
+
+            raise
+
+    def release(self):
+        while self._waiters:
+            future = heapq.heappop(self._waiters)[2]
+            if not future.done():
+                future.set_result(None)
+                return
+
+        self._free += 1
+
+
+class OutboundDispatcher:
+    """
+    Sends Discord messages through per-route queues, one request at a time per route and at most `concurrency`
+    routes at once. Free slots go to user replies first, then thread posts, then logs, so a burst of log embeds
+    can't hold up a moderator's reply. Sends answered with 429 or a 5xx after discord.py's own retries are
+    retried after the Retry-After header or an exponential backoff, holding back the rest of that route
+
+    concurrency: int, requests in flight at once across all routes
+    retries: int, extra attempts for a send that was rate limited or hit a server error
+    backoff: float, seconds before the first retry of a server error, doubled for each further attempt
+    """
+
+    def __init__(self, concurrency=5, retries=2, backoff=1.0):
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self._queues = {}  # route -> heap of (priority, arrival, future, factory, retry, enqueued at, context)
+        self._workers = set()
+        self._slots = PrioritySlots(concurrency)
+        self._arrivals = itertools.count()
+        self.depth = dict.fromkeys(priorityNames, 0)
+
+    async def send(self, destination: discord.abc.Messageable, priority: int, *args, **kwargs) -> discord.Message:
+        """
+        Queues destination.send(*args, **kwargs) and waits for the sent message. Interaction responses
+        have their own rate limits and a response deadline, so they are not sent through here
+        """
+        # discord.py closes files once they're sent, so sends with attachments are only attempted once
+        retry = 'file' not in kwargs and 'files' not in kwargs
+        return await self.run(destination.id, priority, lambda: destination.send(*args, **kwargs), retry)
+
+    async def run(self, route, priority: int, factory, retry=True):
+        """
+        Queues a request behind earlier work for the same route. factory is called to make the request's
+        coroutine, again for every retry
+        """
+        future = asyncio.get_running_loop().create_future()
+        item = (priority, next(self._arrivals), future, factory, retry, time.perf_counter(), contextvars.copy_context())
+        self._count(priority, 1)
+
+        queue = self._queues.get(route)
+        if queue is not None:
+            heapq.heappush(queue, item)
+
+        else:
+            self._queues[route] = [item]
+            worker = asyncio.create_task(self._drain(route))
+            self._workers.add(worker)
+            worker.add_done_callback(self._workers.discard)
+
+        return await future
+
+    def _count(self, priority, change):
+        self.depth[priority] += change
+        metrics.outboundQueueDepth.set(self.depth[priority], priority=priorityNames[priority])
+
+    async def _drain(self, route):
+        queue = self._queues[route]
+        while queue:
+            await self._slots.acquire(queue[0][0])
+            # Anything more urgent queued for this route while waiting for a slot goes first
+            priority, _, future, factory, retry, enqueued, context = heapq.heappop(queue)
+            self._count(priority, -1)
+            metrics.outboundQueueTime.observe(time.perf_counter() - enqueued, priority=priorityNames[priority])
+            attempt = 0
+            error = None
+            while True:
+                try:
+                    # Run in the caller's context, so i.e. tracing spans include the request
+                    result = await context.run(asyncio.ensure_future, factory())
+
+                except discord.HTTPException as e:
+                    delay = self._retry_delay(e, attempt) if retry else None
+                    if delay is None:
+                        error = e
+                        break
+
+                    attempt += 1
+                    metrics.outboundRetries.inc(priority=priorityNames[priority])
+                    logging.warning(f'[Outbound] Send to {route} failed with {e.status}, retrying in {delay:.1f}s')
+                    self._slots.release()  # Other routes keep sending while this one backs off
+                    await asyncio.sleep(delay)
+                    await self._slots.acquire(priority)
+
+                except Exception as e:
+                    error = e
+                    break
+
+                else:
+                    break
+
+            self._slots.release()
+            if future.done():  # The caller was cancelled
+                continue
+
+            if error:
+                future.set_exception(error)
+
+            else:
+                future.set_result(result)
+
+        del self._queues[route]
+
+    def _retry_delay(self, error: discord.HTTPException, attempt: int):
+        """
+        Returns the seconds to wait before retrying a failed send, or None if it shouldn't be retried
+        """
+        if attempt >= self.retries or (error.status != 429 and error.status < 500):
+            return None
+
+        if error.status == 429:
+            try:
+                return float(error.response.headers['Retry-After'])
+
+            except (AttributeError, KeyError, ValueError):
+                pass
+
+        return self.backoff * 2**attempt
+
+
+dispatcher = OutboundDispatcher(
+    getattr(config, 'outboundConcurrency', 5),
+    getattr(config, 'outboundRetries', 2),
+    getattr(config, 'outboundBackoff', 1.0),
+)
+
+
+async def send(destination: discord.abc.Messageable, priority: int, *args, **kwargs) -> discord.Message:
+    return await dispatcher.send(destination, priority, *args, **kwargs)
+
+
+async def run(route, priority: int, factory, retry=True):
+    return await dispatcher.run(route, priority, factory, retry)
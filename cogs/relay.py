@@ -0,0 +1,80 @@
+import asyncio
+import contextlib
+import tempfile
+
+import aiohttp
+import discord
+
+import exceptions
+
+
+class AttachmentRelay:
+    """
+    Relays Discord attachments without holding whole files in memory. Each attachment is streamed
+    from the CDN in fixed-size chunks into a spooled temporary file, which stays in memory until it
+    grows past `spool_size` and is then moved to disk. Uploads read the spool back in chunks as well
+
+    max_size: int, largest attachment in bytes that will be relayed
+    spool_size: int, bytes kept in memory per attachment before spooling to disk
+    chunk_size: int, bytes read from the CDN at a time
+    """
+
+    def __init__(self, max_size=10 * 1024 * 1024, spool_size=1024 * 1024, chunk_size=64 * 1024):
+        self.max_size = max_size
+        self.spool_size = spool_size
+        self.chunk_size = chunk_size
+        self._session = None
+
+    @contextlib.asynccontextmanager
+    async def files(self, attachments: list):
+        """
+        Downloads attachments concurrently and yields them as discord.File objects, which are
+        released when the block exits. Raises exceptions.AttachmentTooLarge if any is over max_size
+        """
+        spools = []
+        files = []
+        try:
+            for attachment in attachments:
+                if attachment.size > self.max_size:
+                    raise exceptions.AttachmentTooLarge(attachment.filename)
+
+                spools.append(tempfile.SpooledTemporaryFile(max_size=self.spool_size))
+
+            downloads = [self._download(a, spool) for a, spool in zip(attachments, spools)]
+            for result in await asyncio.gather(*downloads, return_exceptions=True):
+                if isinstance(result, BaseException):
+                    raise result
+
+            files = [
+                discord.File(spool, filename=a.filename, spoiler=a.is_spoiler(), description=a.description)
+                for a, spool in zip(attachments, spools)
+            ]
+            yield files
+
+        finally:
+            for file in files:
+                file.close()  # Restores the spool's own close(), which discord.File stubs out
+
+            for spool in spools:
+                spool.close()
+
+    async def close(self):
+        if self._session:
+            await self._session.close()
+            self._session = None
+
+    async def _download(self, attachment: discord.Attachment, spool):
+        if not self._session or self._session.closed:
+            self._session = aiohttp.ClientSession()
+
+        received = 0
+        async with self._session.get(attachment.url) as resp:
+            resp.raise_for_status()
+            async for chunk in resp.content.iter_chunked(self.chunk_size):
+                received += len(chunk)
+                if received > self.max_size:  # Attachment metadata can't be trusted to be accurate
+                    raise exceptions.AttachmentTooLarge(attachment.filename)
+
+                spool.write(chunk)
+
+        spool.seek(0)
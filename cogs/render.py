@@ -0,0 +1,160 @@
+import re
+import typing
+
+import discord
+
+import cogs.cache as cache
+
+imagePattern = re.compile(r'\.(gif|jpe?g|tiff|png|webp)(\?[a-zA-Z0-9#-_]*)?$', re.IGNORECASE)
+replyFieldCache = cache.TTLCache(maxsize=2048, ttl=3600)  # message id -> (edited_at, field)
+replyDepth = 4
+
+
+class MessageSnapshot(typing.NamedTuple):
+    """
+    The parts of a DM or reported message that its thread embed is built from. For forwards,
+    the content fields describe the forwarded message and the author/location its origin, if cached
+    """
+
+    content: str
+    stickers: tuple  # (name, url) pairs
+    attachments: tuple  # URLs
+    author: str | None  # 'name (id)', None if the origin of a forward is unknown
+    author_icon: str | None
+    jump_url: str | None
+    location: str | None  # 'channel_id/message_id'
+    forwarded: bool
+    outer_jump_url: str  # The message that was actually sent or reported
+    replies: tuple  # Embed fields for the reply chain, reports only
+
+
+def is_image(url: str) -> bool:
+    return imagePattern.search(url) is not None
+
+
+def snapshot_message(message: discord.Message, attachments: list, report: bool = False) -> MessageSnapshot:
+    """
+    Captures what render_message_embed needs from a discord.Message
+
+    message: discord.Message
+    attachments: list of attachment URLs sent with the message
+    report: bool, whether the message is being reported and its reply chain should be resolved
+    """
+    if message.message_snapshots:
+        # Forwarded message
+        # Discord has future capability for recursive snapshot depths, but only one is returned for now
+        forward = message.message_snapshots[0]
+        origin = forward.cached_message
+        return MessageSnapshot(
+            content=forward.content,
+            stickers=tuple((sticker.name, sticker.url) for sticker in forward.stickers),
+            attachments=tuple(str(x) for x in forward.attachments),
+            author=f'{origin.author} ({origin.author.id})' if origin else None,
+            author_icon=origin.author.display_avatar.url if origin else None,
+            jump_url=origin.jump_url if origin else None,
+            location=f'{origin.channel.id}/{origin.id}' if origin else None,
+            forwarded=True,
+            outer_jump_url=message.jump_url,
+            replies=(),
+        )
+
+    replies = []
+    reply = message.reference.cached_message if report and message.reference else None
+    while reply is not None and len(replies) < replyDepth:
+        replies.append(_reply_field(reply))
+        # Stop once the message isn't cached or doesn't have any more replies in the chain
+        reply = reply.reference.cached_message if reply.reference else None
+
+    return MessageSnapshot(
+        content=message.content,
+        stickers=tuple((sticker.name, sticker.url) for sticker in message.stickers),
+        attachments=tuple(attachments),
+        author=f'{message.author} ({message.author.id})',
+        author_icon=message.author.display_avatar.url,
+        jump_url=message.jump_url,
+        location=f'{message.channel.id}/{message.id}',
+        forwarded=False,
+        outer_jump_url=message.jump_url,
+        replies=tuple(replies),
+    )
+
+
+def _reply_field(reply: discord.Message) -> dict:
+    """
+    Renders one message of a reply chain, memoized by message id until the message is edited
+    """
+    cached = replyFieldCache.get(reply.id)
+    if cached and cached[0] == reply.edited_at:
+        return cached[1]
+
+    if len(reply.content) > 200:
+        replyContent = reply.content[:200] + ' [...]'
+
+    elif not reply.content:
+        replyContent = '*sent a sticker*'
+
+    else:
+        replyContent = reply.content
+
+    field = {'name': f'⤵  In reply to {reply.author}', 'value': f'{reply.jump_url}\n{replyContent}', 'inline': False}
+    replyFieldCache.set(reply.id, (reply.edited_at, field))
+    return field
+
+
+def render_message_embed(snapshot: MessageSnapshot, report: bool = False) -> tuple[str, dict]:
+    """
+    Builds the thread embed for a message snapshot. Returns the transcript content and
+    an embed payload for discord.Embed.from_dict
+    """
+    if snapshot.content:
+        content = snapshot.content
+
+    elif snapshot.stickers:
+        content = '\n'.join([f'*Sent a sticker: {name}*' for name, url in snapshot.stickers])
+
+    else:
+        content = '*No message content.*'
+
+    embed = {
+        'title': 'Message reported' if report else 'New message',
+        'description': content,
+        'color': 0xF381FD if report else 0x32B6CE,
+        'type': 'rich',
+    }
+    fields = []
+    if snapshot.forwarded and snapshot.author:
+        embed['author'] = {'name': f'Forwarded message from {snapshot.author}', 'icon_url': snapshot.author_icon}
+        # Message reports shouldn't traverse through snapshots, jump only to the actual reported message
+        embed['url'] = snapshot.outer_jump_url if report else snapshot.jump_url
+
+    elif snapshot.forwarded:
+        embed['author'] = {'name': 'Forwarded message from unknown author'}
+
+    else:
+        embed['author'] = {'name': snapshot.author, 'icon_url': snapshot.author_icon}
+
+    if not report and snapshot.location:
+        embed['footer'] = {'text': snapshot.location}
+
+    elif report and not snapshot.forwarded:
+        embed['url'] = snapshot.jump_url
+        fields.extend(snapshot.replies)
+
+    if snapshot.stickers:
+        embed['image'] = {'url': snapshot.stickers[0][1]}
+
+    attachments = snapshot.attachments
+    if len(attachments) > 1:  # More than one attachment, use fields
+        for x in range(len(attachments)):
+            fields.append({'name': f'Attachment {x + 1}', 'value': attachments[x], 'inline': True})
+
+    elif attachments and is_image(attachments[0]):  # One attachment, image
+        embed['image'] = {'url': attachments[0]}
+
+    elif attachments:  # Still have an attachment, but not an image
+        fields.append({'name': 'Attachment', 'value': attachments[0], 'inline': True})
+
+    if fields:
+        embed['fields'] = fields
+
+    return content, embed
@@ -0,0 +1,111 @@
+import asyncio
+import heapq
+import logging
+import time
+from datetime import datetime
+
+import cogs.database as database
+
+
+class CloseScheduler:
+    """
+    Restart-safe scheduler for delayed thread closures. Due times are persisted on the thread
+    document in modmail.logs, and a single timer task sleeps until the earliest deadline
+
+    callback: coroutine function called with (thread_id, closer_id) when a close is due, set before starting
+    """
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self._heap = []
+        self._pending = {}  # thread _id -> (due timestamp, closer id)
+        self._wakeup = asyncio.Event()
+        self._task = None
+
+    def __len__(self):
+        return len(self._pending)
+
+    def __contains__(self, thread_id):
+        return thread_id in self._pending
+
+    def due(self, thread_id):
+        entry = self._pending.get(thread_id)
+        return entry[0] if entry else None
+
+    async def load(self):
+        """
+        Loads pending closes from open threads. Overdue closes fire as soon as the timer starts
+        """
+        self._heap.clear()
+        self._pending.clear()
+        query = {'open': True, 'close_scheduled': {'$ne': None}}
+        async with database.logs().find(query, {'close_scheduled': 1}) as cursor:
+            async for doc in cursor:
+                self._push(doc['_id'], doc['close_scheduled']['timestamp'], doc['close_scheduled']['closer_id'])
+
+        self._wakeup.set()
+
+    def start(self):
+        if not self._task or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def schedule(self, thread_id, due: datetime, closer_id):
+        timestamp = int(due.timestamp())
+        await database.logs().update_one(
+            {'_id': thread_id}, {'$set': {'close_scheduled': {'timestamp': timestamp, 'closer_id': str(closer_id)}}}
+        )
+        self._push(thread_id, timestamp, str(closer_id))
+        self._wakeup.set()
+
+    async def cancel(self, thread_id):
+        """
+        Cancels a pending close, returning True if there was one to cancel
+        """
+        if self._pending.pop(thread_id, None) is None:
+            return False
+
+        # The heap entry is left in place and skipped when it comes due
+        await database.logs().update_one({'_id': thread_id}, {'$unset': {'close_scheduled': ''}})
+        return True
+
+    def discard(self, thread_id):
+        """
+        Drops a pending close for a thread that was closed by other means, which clears the stored due time itself
+        """
+        self._pending.pop(thread_id, None)
+
+    def _push(self, thread_id, timestamp, closer_id):
+        self._pending[thread_id] = (timestamp, closer_id)
+        heapq.heappush(self._heap, (timestamp, thread_id))
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            now = time.time()
+            while self._heap and self._heap[0][0] <= now:
+                timestamp, threadID = heapq.heappop(self._heap)
+                entry = self._pending.get(threadID)
+                if not entry or entry[0] != timestamp:
+                    continue  # Canceled or rescheduled since this entry was pushed
+
+                del self._pending[threadID]
+                try:
+                    await self.callback(threadID, entry[1])
+
+                except Exception:
+                    logging.exception(f'[Scheduler] Failed to run scheduled close for thread {threadID}')
+
+            timeout = self._heap[0][0] - time.time() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+
+            except asyncio.TimeoutError:
+                pass
+
+
+closeScheduler = CloseScheduler()
@@ -0,0 +1,230 @@
+import collections
+import contextlib
+import contextvars
+import functools
+import logging
+import re
+import time
+
+import aiohttp
+import config
+from pymongo import monitoring
+
+enabled = getattr(config, 'tracing', False)
+logThreshold = getattr(config, 'tracingLogThreshold', 0.0)  # Seconds, quicker spans are only summarized
+currentSpan = contextvars.ContextVar('currentSpan', default=None)
+routeIDPattern = re.compile(r'/\d{15,}')
+routeTokenPattern = re.compile(r'(/(?:webhooks|interactions)/\{id\}/)[^/]+|(/reactions/)[^/]+')
+
+
+class Span:
+    """
+    One handler invocation, with every Mongo command and Discord REST request issued while it ran
+    """
+
+    __slots__ = ('name', 'started', 'duration', 'mongo', 'http', 'error')
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.duration = None
+        self.mongo = []  # (database.collection, command, seconds, ok)
+        self.http = []  # (method, route, status, seconds)
+        self.error = None
+
+    def finish(self, error=None):
+        self.duration = time.perf_counter() - self.started
+        self.error = error
+
+    def format(self):
+        mongoTime = sum(x[2] for x in self.mongo)
+        httpTime = sum(x[3] for x in self.http)
+        line = (
+            f'span={self.name} duration_ms={self.duration * 1000:.1f} '
+            f'mongo={len(self.mongo)} mongo_ms={mongoTime * 1000:.1f} '
+            f'http={len(self.http)} http_ms={httpTime * 1000:.1f}'
+        )
+        if self.error:
+            line += f' error={type(self.error).__name__}'
+
+        slowest = sorted(
+            [(x[2], f'{x[1]} {x[0]}') for x in self.mongo] + [(x[3], f'{x[0]} {x[1]} {x[2]}') for x in self.http],
+            reverse=True,
+        )[:3]
+        if slowest:
+            line += ' slowest=' + '; '.join(f'{name} {seconds * 1000:.1f}ms' for seconds, name in slowest)
+
+        return line
+
+
+class SpanSummary:
+    """
+    Rolling per-handler statistics over the last `size` spans of each name
+    """
+
+    def __init__(self, size=500):
+        self.size = size
+        self.recent = collections.deque(maxlen=50)
+        self._spans = {}  # name -> deque of (duration, mongo count, mongo seconds, http count, http seconds)
+
+    def add(self, span: Span):
+        self.recent.append(span)
+        window = self._spans.setdefault(span.name, collections.deque(maxlen=self.size))
+        window.append(
+            (
+                span.duration,
+                len(span.mongo),
+                sum(x[2] for x in span.mongo),
+                len(span.http),
+                sum(x[3] for x in span.http),
+            )
+        )
+
+    def stats(self):
+        stats = {}
+        for name, window in self._spans.items():
+            durations = sorted(x[0] for x in window)
+            count = len(window)
+            stats[name] = {
+                'count': count,
+                'p50': durations[count // 2],
+                'p99': durations[min(count - 1, int(count * 0.99))],
+                'mongo': sum(x[1] for x in window) / count,
+                'mongo_time': sum(x[2] for x in window) / count,
+                'http': sum(x[3] for x in window) / count,
+                'http_time': sum(x[4] for x in window) / count,
+            }
+
+        return stats
+
+
+summary = SpanSummary(getattr(config, 'tracingWindow', 500))
+
+
+@contextlib.contextmanager
+def span(name):
+    """
+    Records everything issued inside the block, including from tasks it starts, as one span
+    """
+    if not enabled:
+        yield None
+        return
+
+    current = Span(name)
+    token = currentSpan.set(current)
+    error = None
+    try:
+        yield current
+
+    except BaseException as e:
+        error = e
+        raise
+
+    finally:
+        currentSpan.reset(token)
+        current.finish(error)
+        summary.add(current)
+        if current.duration >= logThreshold:
+            logging.info(f'[Tracing] {current.format()}')
+
+
+def traced(func):
+    """
+    Runs a coroutine function inside its own span. Does nothing unless tracing is enabled in the config,
+    so it should sit closest to the def, below any command or listener decorators
+    """
+    if not enabled:
+        return func
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with span(func.__name__):
+            return await func(*args, **kwargs)
+
+    return wrapper
+
+
+class CommandTracer(monitoring.CommandListener):
+    """
+    Attributes Mongo commands to the span of the handler that issued them. Registered on the shared
+    client by cogs.database when tracing is enabled
+    """
+
+    def __init__(self):
+        self._collections = {}  # (connection, request id) -> namespace
+
+    def started(self, event: monitoring.CommandStartedEvent):
+        if currentSpan.get() is not None:
+            collection = event.command.get(event.command_name)
+            namespace = f'{event.database_name}.{collection}' if isinstance(collection, str) else event.database_name
+            self._collections[(event.connection_id, event.request_id)] = namespace
+
+    def succeeded(self, event: monitoring.CommandSucceededEvent):
+        self._finish(event, True)
+
+    def failed(self, event: monitoring.CommandFailedEvent):
+        self._finish(event, False)
+
+    def _finish(self, event, ok):
+        namespace = self._collections.pop((event.connection_id, event.request_id), None)
+        span = currentSpan.get()
+        if span is not None and namespace is not None:
+            span.mongo.append((namespace, event.command_name, event.duration_micros / 1000000, ok))
+
+
+def trace_requests(trace: aiohttp.TraceConfig):
+    """
+    Adds recording of REST requests on the current span to discord.py's HTTP trace config
+    """
+    if not enabled:
+        return
+
+    async def on_request_start(session, context, params):
+        context.started = time.perf_counter()
+
+    async def on_request_end(session, context, params):
+        _record_request(context, params.method, params.url, params.response.status)
+
+    async def on_request_exception(session, context, params):
+        _record_request(context, params.method, params.url, type(params.exception).__name__)
+
+    trace.on_request_start.append(on_request_start)
+    trace.on_request_end.append(on_request_end)
+    trace.on_request_exception.append(on_request_exception)
+
+
+def route_name(url) -> str:
+    """
+    Reduces a Discord API URL to its route, i.e. /api/v10/channels/{id}/messages. Snowflakes,
+    interaction tokens and reaction emoji are replaced so routes can be grouped and safely logged
+    """
+    path = routeIDPattern.sub('/{id}', url.path)
+    return routeTokenPattern.sub(lambda m: f'{m[1]}{{token}}' if m[1] else f'{m[2]}{{emoji}}', path)
+
+
+def _record_request(context, method, url, status):
+    span = currentSpan.get()
+    if span is not None:
+        span.http.append((method, route_name(url), status, time.perf_counter() - context.started))
+
+
+def dump(recent=10) -> str:
+    """
+    Formats the rolling summary and the most recent spans, i.e. for jishaku:
+    `!jsk py import cogs.tracing as tracing; print(tracing.dump())`
+    """
+    if not enabled:
+        return 'Tracing is disabled, set tracing = True in the config and restart to enable it'
+
+    lines = [f'{"span":<20}{"n":>6}{"p50 ms":>9}{"p99 ms":>9}{"mongo":>7}{"mongo ms":>10}{"http":>6}{"http ms":>9}']
+    for name, stats in sorted(summary.stats().items()):
+        lines.append(
+            f'{name:<20}{stats["count"]:>6}{stats["p50"] * 1000:>9.1f}{stats["p99"] * 1000:>9.1f}'
+            f'{stats["mongo"]:>7.1f}{stats["mongo_time"] * 1000:>10.1f}{stats["http"]:>6.1f}{stats["http_time"] * 1000:>9.1f}'
+        )
+
+    if recent:
+        lines.append('')
+        lines.extend(span.format() for span in list(summary.recent)[-recent:])
+
+    return '\n'.join(lines)
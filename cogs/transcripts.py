@@ -0,0 +1,115 @@
+import asyncio
+import logging
+import uuid
+
+import pymongo
+
+import cogs.database as database
+
+
+class TranscriptWriter:
+    """
+    Write-behind buffer for transcript messages. Appends are collected per thread and written
+    together as one unordered bulk_write a short window after the first buffered message.
+    Writes are idempotent, so a batch whose outcome is unknown can be retried without duplicating messages
+
+    split: bool, insert into modmail.transcripts instead of pushing onto the thread document
+    window: float, seconds to collect appends before flushing
+    """
+
+    def __init__(self, split=False, window=0.5):
+        self.split = split
+        self.window = window
+        self.flushes = 0
+        self.written = 0
+        self._buffers = {}  # thread _id -> messages, in the order they were appended
+        self._lock = asyncio.Lock()
+        self._timer = None
+
+    def __len__(self):
+        return sum(len(messages) for messages in self._buffers.values())
+
+    def append(self, thread_id, message: dict):
+        if self.split:
+            # Fixed here rather than at write time, so retries of the same message hit a duplicate key
+            message = {'_id': f'{thread_id}-{message.get("message_id") or uuid.uuid4().hex}', **message}
+
+        self._buffers.setdefault(thread_id, []).append(message)
+        if not self._timer or self._timer.done():
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def flush(self, thread_id=None):
+        """
+        Writes buffered messages for one thread, or for every thread if none is given
+        """
+        async with self._lock:  # Flushes run one at a time so writes land in append order
+            if thread_id is None:
+                batch, self._buffers = self._buffers, {}
+
+            else:
+                messages = self._buffers.pop(thread_id, None)
+                batch = {thread_id: messages} if messages else {}
+
+            if not batch:
+                return
+
+            if self.split:
+                collection = database.transcripts()
+                owners = [(threadID, 1) for threadID, messages in batch.items() for message in messages]
+                requests = [
+                    pymongo.InsertOne({'thread_id': threadID, **message})
+                    for threadID, messages in batch.items()
+                    for message in messages
+                ]
+
+            else:
+                collection = database.logs()
+                owners = [(threadID, len(messages)) for threadID, messages in batch.items()]
+                requests = [
+                    # $addToSet skips messages a retried batch already pushed, they are identical documents
+                    pymongo.UpdateOne({'_id': threadID}, {'$addToSet': {'messages': {'$each': messages}}})
+                    for threadID, messages in batch.items()
+                ]
+
+            failed = 0
+            try:
+                # Unordered, so one thread's failing write can't stop the writes for every other thread
+                await collection.bulk_write(requests, ordered=False)
+
+            except pymongo.errors.BulkWriteError as e:
+                for error in e.details['writeErrors']:
+                    if error['code'] == 11000:  # Inserted by an earlier attempt of this batch
+                        continue
+
+                    threadID, count = owners[error['index']]
+                    failed += count
+                    logging.error(
+                        f'[Transcripts] Dropped {count} transcript messages for thread {threadID}: {error["errmsg"]}'
+                    )
+
+            except pymongo.errors.PyMongoError as e:
+                # Unknown how much was written, retrying is safe since writes are idempotent
+                logging.warning(f'[Transcripts] Failed to write transcript batch, retrying: {e}')
+                for threadID, messages in self._buffers.items():
+                    batch.setdefault(threadID, []).extend(messages)
+
+                self._buffers = batch
+                if not self._timer or self._timer.done():
+                    self._timer = asyncio.create_task(self._flush_later())
+
+                return
+
+            self.flushes += 1
+            self.written += sum(count for _, count in owners) - failed
+
+    async def close(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+
+        await self.flush()
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.window)
+        self._timer = None
+        await asyncio.shield(self.flush())  # A close() during the write must not drop the batch in flight
@@ -1,3 +1,5 @@
+import asyncio
+import logging
 import time
 import typing
 from datetime import datetime, timedelta, timezone
@@ -6,9 +8,15 @@ import config
 import discord
 import pymongo
 
+import cogs.cache as cache
+import cogs.database as database
+import cogs.members as members
+import cogs.metrics as metrics
+import cogs.outbound as outbound
+import cogs.scheduler as scheduler
+import cogs.transcripts as transcripts
 import exceptions
 
-mclient = pymongo.AsyncMongoClient(config.mongoURI)
 punNames = {
     'strike': '{} Strike{}',
     'destrike': 'Removed {} Strike{}',
@@ -32,6 +40,162 @@ tagIDS = {
     'ban_appeal': config.banAppealTag,
     'message_report': config.messageReportTag,
 }
+splitTranscripts = getattr(config, 'splitTranscripts', False)
+transcriptWriter = transcripts.TranscriptWriter(splitTranscripts, getattr(config, 'transcriptFlushWindow', 0.5))
+userDocCache = cache.TTLCache(getattr(config, 'userCacheSize', 2048), getattr(config, 'userCacheTTL', 15))
+requiredIndexes = {
+    ('modmail', 'logs'): [
+        [('recipient.id', pymongo.ASCENDING), ('open', pymongo.ASCENDING)],
+        [('channel_id', pymongo.ASCENDING)],
+        [('creator.id', pymongo.ASCENDING), ('open', pymongo.ASCENDING)],
+        [('open', pymongo.ASCENDING)],
+    ],
+    ('modmail', 'transcripts'): [[('thread_id', pymongo.ASCENDING), ('timestamp', pymongo.ASCENDING)]],
+    ('bowser', 'puns'): [
+        [('user', pymongo.ASCENDING), ('active', pymongo.ASCENDING)],
+        [('user', pymongo.ASCENDING), ('type', pymongo.ASCENDING), ('timestamp', pymongo.DESCENDING)],
+        [('user', pymongo.ASCENDING), ('timestamp', pymongo.DESCENDING)],
+    ],
+    ('bowser', 'messages'): [[('author', pymongo.ASCENDING), ('timestamp', pymongo.DESCENDING)]],
+}
+noteFetchLimit = 924 // len('[<t:0000000000:d>]: ') + 1  # No more notes than this can fit in the notes field
+hotQueries = [  # (database, collection, filter, sort) shapes of the queries run on thread opens and at startup
+    ('modmail', 'logs', {'open': True}, None),  # Open thread index and scheduled close loads
+    ('modmail', 'logs', {'open': True, 'close_scheduled': {'$ne': None}}, None),
+    ('modmail', 'logs', {'channel_id': '0'}, None),
+    ('modmail', 'logs', {'recipient.id': '0'}, None),  # Previous thread count
+    ('bowser', 'puns', {'user': {'$in': [0]}, 'type': 'appealdeny', 'active': True}, None),
+    ('bowser', 'messages', {'author': 0}, [('timestamp', pymongo.DESCENDING)]),
+]
+threadHeaderProjection = {
+    '_id': 1,
+    'open': 1,
+    'channel_id': 1,
+    'guild_id': 1,
+    'ban_appeal': 1,
+    'recipient.id': 1,
+    'recipient.name': 1,
+    'creator.id': 1,
+}
+
+
+class ThreadHeader(typing.NamedTuple):
+    """
+    Slim view of a modmail.logs thread document, without the transcript
+    """
+
+    id: str
+    open: bool
+    channel_id: int
+    guild_id: int
+    ban_appeal: bool
+    recipient_id: int
+    recipient_name: str
+    creator_id: int
+
+    @classmethod
+    def from_doc(cls, doc):
+        return cls(
+            id=doc['_id'],
+            open=doc.get('open', False),
+            channel_id=int(doc['channel_id']),
+            guild_id=int(doc['guild_id']),
+            ban_appeal=doc.get('ban_appeal', False),
+            recipient_id=int(doc['recipient']['id']),
+            recipient_name=doc['recipient']['name'],
+            creator_id=int(doc['creator']['id']),
+        )
+
+
+class OpenThreadIndex:
+    """
+    Resident registry of open modmail threads, keyed by recipient, channel and creator IDs.
+    Loaded from modmail.logs at cog load and kept current by _create_thread and _close_thread
+    so hot paths can answer "does this user have an open thread" without a database round trip
+    """
+
+    def __init__(self):
+        self._threads = {}
+        self._byRecipient = {}
+        self._byChannel = {}
+        self._byCreator = {}
+
+    def __len__(self):
+        return len(self._threads)
+
+    async def load(self):
+        self.clear()
+        async with database.logs().find({'open': True}, threadHeaderProjection) as cursor:
+            async for doc in cursor:
+                self.add(ThreadHeader.from_doc(doc))
+
+    def clear(self):
+        self._threads.clear()
+        self._byRecipient.clear()
+        self._byChannel.clear()
+        self._byCreator.clear()
+
+    def add(self, thread: ThreadHeader):
+        self.remove(thread.id)
+        self._threads[thread.id] = thread
+        self._byRecipient[thread.recipient_id] = thread.id
+        self._byChannel[thread.channel_id] = thread.id
+        self._byCreator.setdefault(thread.creator_id, set()).add(thread.id)
+
+    def remove(self, thread_id) -> ThreadHeader | None:
+        thread = self._threads.pop(thread_id, None)
+        if not thread:
+            return None
+
+        if self._byRecipient.get(thread.recipient_id) == thread_id:
+            del self._byRecipient[thread.recipient_id]
+
+        if self._byChannel.get(thread.channel_id) == thread_id:
+            del self._byChannel[thread.channel_id]
+
+        created = self._byCreator.get(thread.creator_id)
+        if created:
+            created.discard(thread_id)
+            if not created:
+                del self._byCreator[thread.creator_id]
+
+        return thread
+
+    def get(self, thread_id) -> ThreadHeader | None:
+        return self._threads.get(thread_id)
+
+    def by_recipient(self, user_id: int) -> ThreadHeader | None:
+        return self._threads.get(self._byRecipient.get(int(user_id)))
+
+    def by_channel(self, channel_id: int) -> ThreadHeader | None:
+        return self._threads.get(self._byChannel.get(int(channel_id)))
+
+    def by_creator(self, user_id: int) -> ThreadHeader | None:
+        created = self._byCreator.get(int(user_id))
+        return self._threads[next(iter(created))] if created else None
+
+
+openThreads = OpenThreadIndex()
+
+
+async def _get_thread(channel_id: int, open_only=False, ban_appeal: bool = None) -> ThreadHeader | None:
+    """
+    Looks up the thread header for a thread channel. Open threads are answered from the
+    resident index, closed threads are fetched with a projection that skips the transcript
+
+    channel_id: int
+    open_only: bool, only match open threads
+    ban_appeal: bool, optionally only match (or exclude) ban appeal threads
+    """
+    thread = openThreads.by_channel(channel_id)
+    if not thread and not open_only:
+        doc = await database.logs().find_one({'channel_id': str(channel_id)}, threadHeaderProjection)
+        thread = ThreadHeader.from_doc(doc) if doc else None
+
+    if thread and ban_appeal is not None and thread.ban_appeal != ban_appeal:
+        return None
+
+    return thread
 
 
 def resolve_duration(data):
@@ -119,20 +283,154 @@ def humanize_duration(duration):
     return ', '.join(expires)
 
 
+async def _ensure_indexes():
+    """
+    Creates any missing index in requiredIndexes, then explains each hot query shape
+    and logs a warning if the winning plan still scans the whole collection
+    """
+    for (dbName, colName), indexes in requiredIndexes.items():
+        collection = database.client()[dbName][colName]
+        try:
+            # Directions are compared as stored, text/hashed/2dsphere indexes use strings and 1 == 1.0
+            existing = [list(index['key']) for index in (await collection.index_information()).values()]
+            for keys in indexes:
+                if keys not in existing:
+                    name = await collection.create_index(keys)
+                    logging.info(f'[Indexes] Created index {name} on {dbName}.{colName}')
+
+        except pymongo.errors.PyMongoError as e:
+            logging.warning(f'[Indexes] Unable to verify or create indexes on {dbName}.{colName}: {e}')
+
+    for dbName, colName, query, sort in hotQueries:
+        cursor = database.client()[dbName][colName].find(query, limit=1)
+        if sort:
+            cursor = cursor.sort(sort)
+
+        try:
+            plan = await cursor.explain()
+
+        except pymongo.errors.PyMongoError as e:
+            logging.warning(f'[Indexes] Unable to explain query {query} on {dbName}.{colName}: {e}')
+            continue
+
+        _check_plan(plan, query, dbName, colName)
+
+    # The info card's $facet summary, only its leading $match and $sort can use an index
+    pipeline = _pun_summary_pipeline(0)
+    try:
+        plan = await database.client()['bowser'].command('aggregate', 'puns', pipeline=pipeline, explain=True)
+
+    except pymongo.errors.PyMongoError as e:
+        logging.warning(f'[Indexes] Unable to explain the punishment summary on bowser.puns: {e}')
+
+    else:
+        # Pipelines that aren't pushed down entirely explain their query in the leading $cursor stage
+        _check_plan(plan.get('stages', [{}])[0].get('$cursor', plan), pipeline[:2], 'bowser', 'puns')
+
+
+def _check_plan(plan: dict, query, dbName: str, colName: str):
+    winningPlan = plan.get('queryPlanner', {}).get('winningPlan')
+    if not winningPlan:
+        return logging.warning(f'[Indexes] No query plan in the explain output for {query} on {dbName}.{colName}')
+
+    stages = _plan_stages(winningPlan)
+    if 'COLLSCAN' in stages:
+        logging.warning(
+            f'[Indexes] Query {query} on {dbName}.{colName} will scan the collection. '
+            f'Winning plan: {" <- ".join(stages)}'
+        )
+
+
+def _plan_stages(plan):
+    """
+    Flattens an explain() winning plan tree into a list of stage names, outermost first
+    """
+    stages = []
+    if plan.get('stage'):
+        stages.append(plan['stage'] if not plan.get('indexName') else f'{plan["stage"]} ({plan["indexName"]})')
+
+    for child in [plan.get('inputStage')] + plan.get('inputStages', []) + [plan.get('queryPlan')]:
+        if child:
+            stages += _plan_stages(child)
+
+    return stages
+
+
+async def _get_user_doc(user_id: int):
+    """
+    Returns the bowser.users document for a user, served from a short-lived cache. Users
+    without a document are cached too, so repeat lookups for unknown users stay cheap
+    """
+    doc = userDocCache.get(user_id, cache.MISSING)
+    if doc is cache.MISSING:
+        doc = await database.users().find_one({'_id': user_id})
+        userDocCache.set(user_id, doc)
+
+    return doc
+
+
+def invalidate_user_doc(user_id: int = None):
+    """
+    Drops a user's cached bowser.users document, or every cached document if no user is given
+    """
+    if user_id is None:
+        userDocCache.clear()
+
+    else:
+        userDocCache.invalidate(user_id)
+
+
+async def _watch_user_docs():
+    """
+    Invalidates cached user documents as bowser.users changes, using a change stream.
+    Change streams require a replica set, without one the cache falls back to TTL expiry
+    """
+    while True:
+        try:
+            async with await database.users().watch() as stream:
+                async for change in stream:
+                    if 'documentKey' in change:
+                        userDocCache.invalidate(change['documentKey']['_id'])
+
+                    else:  # Drop, rename or invalidate event, nothing cached can be trusted
+                        userDocCache.clear()
+
+        except pymongo.errors.OperationFailure as e:
+            logging.warning(f'[Cache] Unable to watch bowser.users for changes, relying on TTL expiry: {e}')
+            return
+
+        except pymongo.errors.PyMongoError as e:
+            logging.warning(f'[Cache] bowser.users change stream interrupted, restarting: {e}')
+            userDocCache.clear()
+            await asyncio.sleep(5)
+
+
+async def _load_appeal_denials(user_ids: list) -> dict:
+    cursor = database.puns().find({'user': {'$in': user_ids}, 'type': 'appealdeny', 'active': True})
+    return {pun['user']: pun async for pun in cursor}
+
+
+# A raid or ban wave can send dozens of people to the appeal server at once, their checks share one query
+appealDenials = cache.BatchLoader(_load_appeal_denials, getattr(config, 'appealCheckWindow', 0.05))
+
+
 async def _can_appeal(member):
-    db = mclient.bowser.puns
-    pun = await db.find_one({'user': member.id, 'type': 'appealdeny', 'active': True})
+    pun = await appealDenials.load(member.id)
     if pun:
         try:
             if pun['expiry'] == None:
-                await member.send(
-                    f'You have been automatically kicked from the /r/NintendoSwitch ban appeal server because you cannot make a new appeal. \n\nReason given by moderators:\n```{pun["reason"]}```'
+                await outbound.send(
+                    member,
+                    outbound.USER,
+                    f'You have been automatically kicked from the /r/NintendoSwitch ban appeal server because you cannot make a new appeal. \n\nReason given by moderators:\n```{pun["reason"]}```',
                 )
 
             elif pun['expiry'] > datetime.now(tz=timezone.utc).timestamp():
                 expiry = datetime.fromtimestamp(pun['expiry'], tz=timezone.utc)
-                await member.send(
-                    f'You have been automatically kicked from the /r/NintendoSwitch ban appeal server because you cannot make a new appeal yet. You can join back after __<t:{int(expiry.timestamp())}:f> (approximately <t:{int(expiry.timestamp())}:R>)__ to submit a new appeal with the following invite link: {config.appealInvite}\n\nReason given by moderators:\n```{pun["reason"]}```'
+                await outbound.send(
+                    member,
+                    outbound.USER,
+                    f'You have been automatically kicked from the /r/NintendoSwitch ban appeal server because you cannot make a new appeal yet. You can join back after __<t:{int(expiry.timestamp())}:f> (approximately <t:{int(expiry.timestamp())}:R>)__ to submit a new appeal with the following invite link: {config.appealInvite}\n\nReason given by moderators:\n```{pun["reason"]}```',
                 )
 
         except:
@@ -159,7 +457,7 @@ async def _create_thread(
     created_at=None,
     report=None,
 ):
-    db = mclient.modmail.logs
+    db = database.logs()
     initial_message = None
     if message:
         attachments = [x.url for x in message.attachments]
@@ -189,39 +487,90 @@ async def _create_thread(
     else:
         _id = str(channel.id) + '-' + str(int(time.time()))
 
-    await db.insert_one(
-        {
-            '_id': _id,
-            'key': _id,
-            'open': True,
-            'created_at': created_at,
-            'closed_at': None,
-            'channel_id': str(channel.id),
-            'guild_id': str(channel.guild.id),
-            'bot_id': str(bot.user.id),
-            'ban_appeal': ban_appeal,
-            'recipient': {
-                'id': str(recipient.id),
-                'name': recipient.name,
-                'discriminator': recipient.discriminator,
-                'avatar_url': str(recipient.display_avatar.with_static_format('png').with_size(1024)),
-                'mod': False,
-            },
-            'creator': {
-                'id': str(creator.id),
-                'name': creator.name,
-                'discriminator': creator.discriminator,
-                'avatar_url': str(creator.display_avatar.with_static_format('png').with_size(1024)),
-                'mod': False,
-            },
-            'closer': None,
-            'messages': [] if not initial_message else [initial_message],
-        }
-    )
+    threadDoc = {
+        '_id': _id,
+        'key': _id,
+        'open': True,
+        'created_at': created_at,
+        'closed_at': None,
+        'channel_id': str(channel.id),
+        'guild_id': str(channel.guild.id),
+        'bot_id': str(bot.user.id),
+        'ban_appeal': ban_appeal,
+        'recipient': {
+            'id': str(recipient.id),
+            'name': recipient.name,
+            'discriminator': recipient.discriminator,
+            'avatar_url': str(recipient.display_avatar.with_static_format('png').with_size(1024)),
+            'mod': False,
+        },
+        'creator': {
+            'id': str(creator.id),
+            'name': creator.name,
+            'discriminator': creator.discriminator,
+            'avatar_url': str(creator.display_avatar.with_static_format('png').with_size(1024)),
+            'mod': False,
+        },
+        'closer': None,
+        'messages': [] if not initial_message or splitTranscripts else [initial_message],
+    }
+    if splitTranscripts:
+        threadDoc['split_transcript'] = True
+
+    await db.insert_one(threadDoc)
+    openThreads.add(ThreadHeader.from_doc(threadDoc))
+    if initial_message and splitTranscripts:
+        _append_message(_id, initial_message)
 
     return _id
 
 
+def _append_message(thread_id, message: dict):
+    """
+    Queues a message to be appended to a thread transcript. With splitTranscripts enabled each message is stored
+    as its own document in modmail.transcripts, otherwise it is pushed onto the thread document's messages array.
+    Messages are written in batches by transcriptWriter, call transcriptWriter.flush() to write them immediately
+
+    thread_id: str
+    message: dict
+    """
+    transcriptWriter.append(thread_id, message)
+
+
+async def _migrate_transcripts():
+    """
+    Moves embedded messages arrays out of modmail.logs into modmail.transcripts. Safe to rerun,
+    messages that were already copied are skipped. Returns a tuple of (threads, messages) migrated
+    """
+    if not splitTranscripts:
+        raise RuntimeError('splitTranscripts must be enabled before migrating transcripts')
+
+    await transcriptWriter.flush()
+    db = database.logs()
+    transcripts = database.transcripts()
+    threadCnt = 0
+    messageCnt = 0
+    async with db.find({'messages.0': {'$exists': True}}, {'messages': 1}) as cursor:
+        async for doc in cursor:
+            messages = [
+                {'_id': f'{doc["_id"]}-{i}', 'thread_id': doc['_id'], **message}
+                for i, message in enumerate(doc['messages'])
+            ]
+            try:
+                await transcripts.insert_many(messages, ordered=False)
+
+            except pymongo.errors.BulkWriteError as e:
+                # Duplicate keys are messages copied by a previous, interrupted run
+                if any(error['code'] != 11000 for error in e.details['writeErrors']):
+                    raise
+
+            await db.update_one({'_id': doc['_id']}, {'$set': {'messages': [], 'split_transcript': True}})
+            threadCnt += 1
+            messageCnt += len(messages)
+
+    return threadCnt, messageCnt
+
+
 async def _close_thread(
     bot,
     mod_user: discord.User,
@@ -231,8 +580,9 @@ async def _close_thread(
     dm: bool = True,
     reason: str = None,
 ):
-    db = mclient.modmail.logs
-    doc = await db.find_one({'channel_id': str(thread_channel.id)})
+    db = database.logs()
+    thread = await _get_thread(thread_channel.id)
+    await transcriptWriter.flush(thread.id)
 
     closeInfo = {
         '$set': {
@@ -245,12 +595,16 @@ async def _close_thread(
                 'avatar_url': str(mod_user.display_avatar.with_static_format('png').with_size(1024)),
                 'mod': True,
             },
-        }
+        },
+        '$unset': {'close_scheduled': ''},  # Closed before a scheduled close came due
     }
 
     if reason:
         closeInfo['$set']['close_message'] = reason
-    await db.update_one({'_id': doc['_id']}, closeInfo)
+    await db.update_one({'_id': thread.id}, closeInfo)
+    openThreads.remove(thread.id)
+    scheduler.closeScheduler.discard(thread.id)
+    metrics.threadsClosed.inc(type='ban_appeal' if thread.ban_appeal else 'thread')
 
     try:
         channel = bot.get_channel(thread_channel.id)
@@ -260,26 +614,49 @@ async def _close_thread(
         pass
 
     if dm:
+        notified = False
         try:
-            mailer = await guild.fetch_member(int(doc['recipient']['id']))
-            await mailer.send(
-                '__Your modmail thread has been closed__. If you need to contact the chat-moderators you may send me another DM to open a new modmail thread'
-            )
+            mailer = await members.get_member(guild, thread.recipient_id)
+            if mailer:
+                await outbound.send(
+                    mailer,
+                    outbound.USER,
+                    '__Your modmail thread has been closed__. If you need to contact the chat-moderators you may send me another DM to open a new modmail thread',
+                )
+                notified = True
 
         except (discord.HTTPException, discord.Forbidden, discord.NotFound):
-            await bot.get_channel(config.adminChannel).send(
-                f'Failed to send DM to <@{doc["recipient"]["id"]}> for modmail closure. They have not been notified'
-            )
+            pass
 
-    user = doc['recipient']
+        if not notified:
+            await outbound.send(
+                bot.get_channel(config.adminChannel),
+                outbound.LOG,
+                f'Failed to send DM to <@{thread.recipient_id}> for modmail closure. They have not been notified',
+            )
 
     embed = discord.Embed(description=thread_channel.jump_url, color=0xB8E986, timestamp=datetime.now(tz=timezone.utc))
 
-    embed.set_author(name=f'Modmail closed | {user["name"]} ({user["id"]})')
+    embed.set_author(name=f'Modmail closed | {thread.recipient_name} ({thread.recipient_id})')
 
-    embed.add_field(name='User', value=f'<@{user["id"]}>', inline=True)
+    embed.add_field(name='User', value=f'<@{thread.recipient_id}>', inline=True)
     embed.add_field(name='Moderator', value=f'{mod_user.mention}', inline=True)
-    await target_channel.send(embed=embed)
+    await outbound.send(target_channel, outbound.LOG, embed=embed)
+
+
+def _format_active_puns(puns: list) -> str:
+    description = ''
+    for pun in puns:
+        timestamp = f'<t:{int(pun["timestamp"])}:f>'
+        if pun['type'] == 'strike':
+            description += f"**{punNames[pun['type']].format(pun['active_strike_count'], 's' if pun['active_strike_count'] > 1 else '')}** by <@{pun['moderator']}> on {timestamp}\n    ･ {pun['reason']}\n"
+
+        else:
+            description += (
+                f"**{punNames[pun['type']]}** by <@{pun['moderator']}> on {timestamp}\n    ･ {pun['reason']}\n"
+            )
+
+    return description
 
 
 async def _trigger_create_user_thread(
@@ -293,41 +670,38 @@ async def _trigger_create_user_thread(
     anonymous=True,
     interaction=None,
 ):
-    db = mclient.modmail.logs
-    punsDB = mclient.bowser.puns
-    usersDB = mclient.bowser.users
     successfulDM = False
 
     guild = bot.get_guild(config.guild)
     appealGuild = bot.get_guild(config.appealGuild)
-    try:
-        await guild.fetch_member(member.id)
-
-    except discord.NotFound:
+    guildMember = await members.get_member(guild, member.id)
+    if not guildMember:
         # If the user is not in the primary guild. Failsafe check in-case on_member_join didn't catch them
         open_type = 'ban_appeal'
-        try:
-            await guild.fetch_ban(member)
-
-        except discord.NotFound:
-            await member.send(
-                'You are not banned from /r/NintendoSwitch and have been kicked from the ban appeal server.'
+        if not await members.is_banned(guild, member.id):
+            await outbound.send(
+                member,
+                outbound.USER,
+                'You are not banned from /r/NintendoSwitch and have been kicked from the ban appeal server.',
             )
-            appealMember = await appealGuild.fetch_member(member.id)
-            await appealMember.kick(reason='Member is not banned on /r/NintendoSwitch')
+            appealMember = await members.get_member(appealGuild, member.id)
+            if appealMember:
+                await appealMember.kick(reason='Member is not banned on /r/NintendoSwitch')
 
             raise RuntimeError('User is not banned from server')
 
-        else:
-            if not await _can_appeal(member):
-                raise RuntimeError('User cannot appeal')
+        if not await _can_appeal(member):
+            raise RuntimeError('User cannot appeal')
 
-    # Deny thread creation if modmail restricted
+    # Deny thread creation if modmail restricted, before loading the snapshot since blacklisted users DM the most
+    userDoc = cache.MISSING
     if open_type == 'user':
-        user_doc = await usersDB.find_one({'_id': member.id})
-        if not user_doc['modmail']:
+        userDoc = await _get_user_doc(member.id)
+        if not userDoc['modmail']:
             raise exceptions.ModmailBlacklisted
 
+    snapshot = await _load_moderation_snapshot(bot, guildMember if guildMember else member.id, userDoc)
+
     forum = guild.get_channel(config.forumChannel)
     postName = member.name + ' - '
     if open_type == 'ban_appeal':
@@ -342,9 +716,7 @@ async def _trigger_create_user_thread(
         icon_url=member.display_avatar.with_static_format('png').with_size(1024),
     )
 
-    threadCount = await db.count_documents({'recipient.id': str(member.id)})
-
-    punsCnt = await punsDB.count_documents({'user': member.id, 'active': True})
+    threadCount = snapshot.thread_count
     if open_type == 'ban_appeal':
         description = f'A new ban appeal has been submitted by {member} ({member.mention}) and needs to be reviewed.'
 
@@ -360,25 +732,19 @@ async def _trigger_create_user_thread(
         postName += 'Modmail'
         description = f"A new modmail needs to be reviewed from {member} ({member.mention}). There are {threadCount} previous threads involving this user."
 
-    if punsCnt:
-        description += '\n\n__User has active punishments:__\n'
-        puns = punsDB.find({'user': member.id, 'active': True})
-        async for pun in puns:
-            timestamp = f'<t:{int(pun["timestamp"])}:f>'
-            if pun['type'] == 'strike':
-                description += f"**{punNames[pun['type']].format(pun['active_strike_count'], 's' if pun['active_strike_count'] > 1 else '')}** by <@{pun['moderator']}> on {timestamp}\n    ･ {pun['reason']}\n"
-
-            else:
-                description += (
-                    f"**{punNames[pun['type']]}** by <@{pun['moderator']}> on {timestamp}\n    ･ {pun['reason']}\n"
-                )
-
-        await puns.close()
+    if snapshot.info.active_puns:
+        description += '\n\n__User has active punishments:__\n' + _format_active_puns(snapshot.info.active_puns)
 
     embed.description = description
     tag = forum.get_tag(tagIDS[open_type])
-    thread, threadMessage = await forum.create_thread(
-        name=postName, auto_archive_duration=10080, embed=embed, applied_tags=[tag], reason='New modmail opened'
+    # Not retried by the dispatcher, a create that failed after reaching Discord would open a second thread
+    thread, threadMessage = await outbound.run(
+        forum.id,
+        outbound.THREAD,
+        lambda: forum.create_thread(
+            name=postName, auto_archive_duration=10080, embed=embed, applied_tags=[tag], reason='New modmail opened'
+        ),
+        retry=False,
     )
     await _create_thread(
         bot,
@@ -392,22 +758,23 @@ async def _trigger_create_user_thread(
         message=message,
         report=interaction,
     )
-    await _info(
-        await bot.get_context(threadMessage),
-        bot,
-        member.id if open_type == 'ban_appeal' else await guild.fetch_member(member.id),
-    )
+    metrics.threadsOpened.inc(type=open_type)
+    await _info(await bot.get_context(threadMessage), bot, guildMember if guildMember else member.id, snapshot.info)
 
     if open_type == 'ban_appeal':
-        await member.send(
-            f'Hi there!\nYou have submitted a ban appeal to the chat moderators who oversee the **{guild.name}** Discord.\n\nI will send you a message when a moderator responds to this thread. Every message you send to me while your thread is open will also be sent to the moderation team -- so you can message me anytime to add information or to reply to a moderator\'s message. You\'ll know your message has been sent when I react to your message with a ✅.\n\nPlease be patient for a response; the moderation team will have active discussions about the appeal and may take some time to reply. We ask that you be civil and respectful during this process so constructive conversation can be had in both directions. At the end of this process, moderators will either lift or uphold your ban -- you will receive an official message stating the final decision.'
+        await outbound.send(
+            member,
+            outbound.USER,
+            f'Hi there!\nYou have submitted a ban appeal to the chat moderators who oversee the **{guild.name}** Discord.\n\nI will send you a message when a moderator responds to this thread. Every message you send to me while your thread is open will also be sent to the moderation team -- so you can message me anytime to add information or to reply to a moderator\'s message. You\'ll know your message has been sent when I react to your message with a ✅.\n\nPlease be patient for a response; the moderation team will have active discussions about the appeal and may take some time to reply. We ask that you be civil and respectful during this process so constructive conversation can be had in both directions. At the end of this process, moderators will either lift or uphold your ban -- you will receive an official message stating the final decision.',
         )
         successfulDM = True
 
     else:
         try:
-            await member.send(
-                f'Hi there!\nYou have opened a modmail thread with the chat moderators who oversee the **{guild.name}** Discord and they have received your message.\n\nI will send you a message when moderators respond to this thread. Every message you send to me while your thread is open will also be sent to the moderation team -- so you can message me anytime to add information or to reply to a moderator\'s message. You\'ll know your message has been sent when I react to your message with a ✅. \n\nPlease be patient for a response; if this is an urgent issue you may also ping the Chat-Mods with @Chat-Mods in a channel'
+            await outbound.send(
+                member,
+                outbound.USER,
+                f'Hi there!\nYou have opened a modmail thread with the chat moderators who oversee the **{guild.name}** Discord and they have received your message.\n\nI will send you a message when moderators respond to this thread. Every message you send to me while your thread is open will also be sent to the moderation team -- so you can message me anytime to add information or to reply to a moderator\'s message. You\'ll know your message has been sent when I react to your message with a ✅. \n\nPlease be patient for a response; if this is an urgent issue you may also ping the Chat-Mods with @Chat-Mods in a channel',
             )
             successfulDM = True
 
@@ -418,15 +785,12 @@ async def _trigger_create_user_thread(
 
 
 async def _trigger_create_mod_thread(bot, guild, member, moderator):
-    db = mclient.modmail.logs
-    punsDB = mclient.bowser.puns
+    db = database.logs()
 
     guild = bot.get_guild(config.guild)
     appealGuild = bot.get_guild(config.appealGuild)
-    try:
-        await guild.fetch_member(member.id)
-
-    except discord.NotFound:
+    guildMember = await members.get_member(guild, member.id)
+    if not guildMember:
         raise RuntimeError('Invalid user')  # TODO: We need custom exceptions
 
     forum = guild.get_channel(config.forumChannel)
@@ -440,47 +804,41 @@ async def _trigger_create_mod_thread(bot, guild, member, moderator):
         icon_url=member.display_avatar.with_static_format('png').with_size(1024),
     )
 
-    threadCount = await db.count_documents({'recipient.id': str(member.id)})
-    punsCnt = await punsDB.count_documents({'user': member.id, 'active': True})
-
-    description = f'A modmail thread has been opened with {member} ({member.mention}) by {moderator} ({moderator.mention}). There are {threadCount} previous threads involving this user.'
-
-    if punsCnt:
-        description += '\n\n__User has active punishments:__\n'
-        puns = punsDB.find({'user': member.id, 'active': True})
-        async for pun in puns:
-            timestamp = f'<t:{int(pun["timestamp"])}:f>'
-            if pun['type'] == 'strike':
-                description += f"**{punNames[pun['type']].format(pun['active_strike_count'], 's' if pun['active_strike_count'] > 1 else '')}** by <@{pun['moderator']}> on {timestamp}\n    ･ {pun['reason']}\n"
-
-            else:
-                description += (
-                    f"**{punNames[pun['type']]}** by <@{pun['moderator']}> on {timestamp}\n    ･ {pun['reason']}\n"
-                )
+    snapshot = await _load_moderation_snapshot(bot, guildMember)
+    description = f'A modmail thread has been opened with {member} ({member.mention}) by {moderator} ({moderator.mention}). There are {snapshot.thread_count} previous threads involving this user.'
 
-        await puns.close()
+    if snapshot.info.active_puns:
+        description += '\n\n__User has active punishments:__\n' + _format_active_puns(snapshot.info.active_puns)
 
     embed.description = description
-    thread, threadMessage = await forum.create_thread(
-        name=postName,
-        auto_archive_duration=10080,
-        content=moderator.mention,
-        embed=embed,
-        applied_tags=[tag],
-        reason='New modmail opened',
+    thread, threadMessage = await outbound.run(
+        forum.id,
+        outbound.THREAD,
+        lambda: forum.create_thread(
+            name=postName,
+            auto_archive_duration=10080,
+            content=moderator.mention,
+            embed=embed,
+            applied_tags=[tag],
+            reason='New modmail opened',
+        ),
+        retry=False,
     )
     docID = await _create_thread(
         bot, thread, moderator, member, created_at=datetime.now(tz=timezone.utc).isoformat(sep=' ')
     )  # Since we don't have a reference with slash commands, pull current iso datetime in UTC
-    await _info(await bot.get_context(threadMessage), bot, await guild.fetch_member(member.id))
+    await _info(await bot.get_context(threadMessage), bot, guildMember, snapshot.info)
     try:
-        await member.send(
-            f'Hi there!\nThe chat moderators who oversee the **{guild.name}** Discord have opened a modmail with you!\n\nI will send you a message when a moderator responds to this thread. Every message you send to me while your thread is open will also be sent to the moderation team -- so you can message me anytime to add information or to reply to a moderator\'s message. You\'ll know your message has been sent when I react to your message with a ✅.'
+        await outbound.send(
+            member,
+            outbound.USER,
+            f'Hi there!\nThe chat moderators who oversee the **{guild.name}** Discord have opened a modmail with you!\n\nI will send you a message when a moderator responds to this thread. Every message you send to me while your thread is open will also be sent to the moderation team -- so you can message me anytime to add information or to reply to a moderator\'s message. You\'ll know your message has been sent when I react to your message with a ✅.',
         )
 
     except discord.Forbidden:
         # Cleanup if there really was an issue messaging the user, i.e. bot blocked
         await db.delete_one({'_id': docID})
+        openThreads.remove(docID)
         await thread.delete()
         raise
 
@@ -489,37 +847,164 @@ async def _trigger_create_mod_thread(bot, guild, member, moderator):
         description='This thread is now open to moderator and user replies. Start the conversation by using `/reply` or `/areply`',
         color=0x58B9FF,
     )
-    await thread.send(content=f'<@&{config.modRole}>', embed=embed, silent=True)
+    await outbound.send(thread, outbound.THREAD, content=f'<@&{config.modRole}>', embed=embed, silent=True)
+    metrics.threadsOpened.inc(type='moderator')
+
+
+class InfoData(typing.NamedTuple):
+    """
+    Everything the user info card displays, loaded ahead of rendering
+    """
+
+    user: discord.abc.User
+    in_server: bool
+    db_user: dict | None
+    message_count: int
+    last_message: dict | None
+    note_count: int
+    notes: list
+    pun_count: int
+    puns: list
+    active_strikes: int
+    total_strikes: int
+    active_mute: int | None
+    active_puns: list
+
+
+class ModerationSnapshot(typing.NamedTuple):
+    """
+    Per-user data shared by the forum opening embed and the info card of a new thread
+    """
+
+    thread_count: int
+    info: InfoData
+
+
+async def _info(ctx, bot, user: typing.Union[discord.Member, int], data: InfoData = None):
+    if not data:
+        data = await _load_info(bot, user)
+
+    return await outbound.send(ctx.channel, outbound.THREAD, embed=_render_info(ctx.guild, data))
+
+
+async def _load_moderation_snapshot(
+    bot, user: typing.Union[discord.Member, int], db_user=cache.MISSING
+) -> ModerationSnapshot:
+    """
+    Loads everything a thread open needs to know about a user once, for both the opening embed and info card.
+    Pass db_user if the bowser.users document was already loaded
+    """
+    userID = user if type(user) == int else user.id
+    threadCount, info = await asyncio.gather(
+        database.logs().count_documents({'recipient.id': str(userID)}), _load_info(bot, user, db_user)
+    )
+    return ModerationSnapshot(thread_count=threadCount, info=info)
 
 
-async def _info(ctx, bot, user: typing.Union[discord.Member, int]):
-    inServer = True
-    if type(user) == int:
+async def _load_info(bot, user: typing.Union[discord.Member, int], db_user=cache.MISSING) -> InfoData:
+    """
+    Runs every query the info card needs concurrently, none of them depend on each other
+    """
+    inServer = type(user) != int
+    userID = user.id if inServer else user
+    msgDB = database.messages()
+
+    queries = [
+        msgDB.count_documents({'author': userID}),
+        msgDB.find_one({'author': userID}, sort=[('timestamp', pymongo.DESCENDING)]),
+        _load_pun_summary(userID),
+    ]
+    if db_user is cache.MISSING:
+        queries.append(_get_user_doc(userID))
+
+    if not inServer:
         # User doesn't share the ctx server, fetch it instead
-        dbUser = await mclient.bowser.users.find_one({'_id': user})
-        inServer = False
+        queries.append(members.get_user(bot, userID))
+
+    msgCount, lastMsg, punSummary, *fetched = await asyncio.gather(*queries)
+    dbUser = fetched.pop(0) if db_user is cache.MISSING else db_user
+    strikes = punSummary['strikes'][0] if punSummary['strikes'] else {'active': 0, 'total': 0}
+    return InfoData(
+        user=fetched[0] if fetched else user,
+        in_server=inServer,
+        db_user=dbUser,
+        message_count=msgCount,
+        last_message=lastMsg,
+        note_count=punSummary['note_count'][0]['count'] if punSummary['note_count'] else 0,
+        notes=punSummary['notes'],
+        pun_count=punSummary['pun_count'][0]['count'] if punSummary['pun_count'] else 0,
+        puns=punSummary['puns'],
+        active_strikes=strikes['active'],
+        total_strikes=strikes['total'],
+        active_mute=punSummary['active_mute'][0]['expiry'] if punSummary['active_mute'] else None,
+        active_puns=punSummary['active_puns'],
+    )
 
-        user = await bot.fetch_user(user)
 
-        if not dbUser:
-            embed = discord.Embed(
-                color=discord.Color(0x18EE1C),
-                description=f'Fetched information about {user.mention} from the API because they are not in this server. There is little information to display as they have not been recorded joining the server before.',
-            )
-            embed.set_author(
-                name=f'{str(user)} | {user.id}',
-                icon_url=user.display_avatar.with_static_format('png').with_size(1024),
-            )
-            embed.set_thumbnail(url=user.display_avatar.with_static_format('png').with_size(1024))
-            embed.add_field(name='Created', value=f'<t:{int(user.created_at.timestamp())}:f>')
-            return await ctx.send(embed=embed)  # TODO: Return DB info if it exists as well
+async def _load_pun_summary(user_id: int) -> dict:
+    """
+    Summarizes a user's notes and punishments for the info card in a single $facet aggregation,
+    so only the entries that will be displayed are sent over the wire
+    """
+    async with await database.puns().aggregate(_pun_summary_pipeline(user_id)) as cursor:
+        return await cursor.next()
 
-    else:
-        dbUser = await mclient.bowser.users.find_one({'_id': user.id})
 
-    # Member object, loads of info to work with
-    msgDB = mclient.bowser.messages
-    msgCount = await msgDB.count_documents({'author': user.id})
+def _pun_summary_pipeline(user_id: int) -> list:
+    isStrike = {'$eq': ['$type', 'strike']}
+    return [
+        {'$match': {'user': user_id}},
+        {'$sort': {'timestamp': pymongo.DESCENDING}},
+        {
+            '$facet': {
+                'notes': [
+                    {'$match': {'type': 'note'}},
+                    {'$limit': noteFetchLimit},
+                    {'$project': {'timestamp': 1, 'reason': 1}},
+                ],
+                'note_count': [{'$match': {'type': 'note'}}, {'$count': 'count'}],
+                'puns': [{'$match': {'type': {'$ne': 'note'}}}, {'$limit': 5}],
+                'pun_count': [{'$match': {'type': {'$ne': 'note'}}}, {'$count': 'count'}],
+                'strikes': [
+                    {'$match': {'type': {'$in': ['strike', 'destrike']}}},
+                    {
+                        '$group': {
+                            '_id': None,
+                            'active': {'$sum': {'$cond': [isStrike, '$active_strike_count', 0]}},
+                            'total': {
+                                '$sum': {'$cond': [isStrike, '$strike_count', {'$multiply': ['$strike_count', -1]}]}
+                            },
+                        }
+                    },
+                ],
+                'active_mute': [  # Oldest active mute, matching the previous client-side scan
+                    {'$match': {'type': 'mute', 'active': True}},
+                    {'$sort': {'timestamp': pymongo.ASCENDING}},
+                    {'$limit': 1},
+                    {'$project': {'expiry': 1}},
+                ],
+                'active_puns': [{'$match': {'active': True}}, {'$sort': {'timestamp': pymongo.ASCENDING}}],
+            }
+        },
+    ]
+
+
+def _render_info(guild: discord.Guild, data: InfoData) -> discord.Embed:
+    user = data.user
+    inServer = data.in_server
+    dbUser = data.db_user
+    if not inServer and not dbUser:
+        embed = discord.Embed(
+            color=discord.Color(0x18EE1C),
+            description=f'Fetched information about {user.mention} from the API because they are not in this server. There is little information to display as they have not been recorded joining the server before.',
+        )
+        embed.set_author(
+            name=f'{str(user)} | {user.id}',
+            icon_url=user.display_avatar.with_static_format('png').with_size(1024),
+        )
+        embed.set_thumbnail(url=user.display_avatar.with_static_format('png').with_size(1024))
+        embed.add_field(name='Created', value=f'<t:{int(user.created_at.timestamp())}:f>')
+        return embed  # TODO: Return DB info if it exists as well
 
     desc = (
         f'Fetched user {user.mention}.'
@@ -535,7 +1020,7 @@ async def _info(ctx, bot, user: typing.Union[discord.Member, int]):
         icon_url=user.display_avatar.with_static_format('png').with_size(1024),
     )
     embed.set_thumbnail(url=user.display_avatar.with_static_format('png').with_size(1024))
-    embed.add_field(name='Messages', value=str(msgCount), inline=True)
+    embed.add_field(name='Messages', value=str(data.message_count), inline=True)
     if inServer:
         embed.add_field(name='Join date', value=f'<t:{int(user.joined_at.timestamp())}:f>', inline=True)
 
@@ -558,79 +1043,60 @@ async def _info(ctx, bot, user: typing.Union[discord.Member, int]):
         if not inServer:
             tempList = []
             for x in reversed(roleList):
-                y = ctx.guild.get_role(x)
+                y = guild.get_role(x)
                 name = '*deleted role*' if not y else y.name
                 tempList.append(name)
 
             roleList = tempList
 
         # concat roles into comma delimitered string
-        roles = str(roleList[0])
+        roleNames = [str(roleList[0])]
+        length = len(roleNames[0])
         for i, role in enumerate(roleList[1:]):
-            if len(f"{roles}, {role}") > 1000:  # too big?
-                roles += f", and {len(roleList) - i} more..."
+            length += len(role) + 2
+            if length > 1000:  # too big?
+                roleNames.append(f'and {len(roleList) - i} more...')
                 break
 
-            roles += f", {role}"
+            roleNames.append(role)
+
+        roles = ', '.join(roleNames)
 
     embed.add_field(name='Roles', value=roles, inline=False)
-    lastMsg = 'N/a'
-    async with msgDB.find({'author': user.id}).sort("timestamp", pymongo.DESCENDING) as cursor:
-        async for msg in cursor:
-            lastMsg = f'<t:{msg["timestamp"]}:f>'
-            break
+    lastMsg = 'N/a' if not data.last_message else f'<t:{data.last_message["timestamp"]}:f>'
 
     embed.add_field(name='Last message', value=lastMsg, inline=True)
     embed.add_field(name='Created', value=f'<t:{int(user.created_at.timestamp())}:f>', inline=True)
 
-    noteCnt = await mclient.bowser.puns.count_documents({'user': user.id, 'type': 'note'})
+    noteCnt = data.note_count
     fieldValue = 'View history to get full details on all notes.\n\n'
     if noteCnt:
-        noteDocs = mclient.bowser.puns.find({'user': user.id, 'type': 'note'})
         noteList = []
-        async for x in noteDocs.sort('timestamp', pymongo.DESCENDING):
+        fieldLength = 0
+        for x in data.notes:
             stamp = f'[<t:{int(x["timestamp"])}:d>]'
             noteContent = f'{stamp}: {x["reason"]}'
 
-            fieldLength = 0
-            for value in noteList:
-                fieldLength += len(value)
             if len(noteContent) + fieldLength > 924:
                 fieldValue = f'Only showing {len(noteList)}/{noteCnt} notes. ' + fieldValue
                 break
 
             noteList.append(noteContent)
+            fieldLength += len(noteContent)
 
-        await noteDocs.close()
         embed.add_field(name='User notes', value=fieldValue + '\n'.join(noteList), inline=False)
 
     punishments = ''
-    punsCnt = await mclient.bowser.puns.count_documents({'user': user.id, 'type': {'$ne': 'note'}})
+    punsCnt = data.pun_count
     if not punsCnt:
         punishments = '__*No punishments on record*__'
 
     else:
-        puns = 0
-        activeStrikes = 0
-        totalStrikes = 0
-        activeMute = None
-        punsCol = mclient.bowser.puns.find({'user': user.id, 'type': {'$ne': 'note'}})
-        async for pun in punsCol.sort('timestamp', pymongo.DESCENDING):
-            if pun['type'] == 'strike':
-                totalStrikes += pun['strike_count']
-                activeStrikes += pun['active_strike_count']
-
-            elif pun['type'] == 'destrike':
-                totalStrikes -= pun['strike_count']
-
-            elif pun['type'] == 'mute':
-                if pun['active']:
-                    activeMute = pun['expiry']
-
-            if puns >= 5:
-                continue
-
-            puns += 1
+        puns = len(data.puns)
+        activeStrikes = data.active_strikes
+        totalStrikes = data.total_strikes
+        activeMute = data.active_mute
+        for pun in data.puns:
             stamp = f'<t:{int(pun["timestamp"])}:f>'
             punType = punNames[pun['type']]
             if pun['type'] in ['clear', 'unmute', 'unban', 'unblacklist', 'destrike']:
@@ -645,7 +1111,6 @@ async def _info(ctx, bot, user: typing.Union[discord.Member, int]):
             else:
                 punishments += f'> {config.addTick} {stamp} **{punType}**\n'
 
-        await punsCol.close()
         punishments = (
             f'Showing {puns}/{punsCnt} punishment entries. '
             f'For a full history including responsible moderator, active status, and more use the `/history {user.id}` command'
@@ -659,7 +1124,7 @@ async def _info(ctx, bot, user: typing.Union[discord.Member, int]):
             embed.description += f'\nUser currently has {activeStrikes} active strike{"s" if activeStrikes != 1 else ""} ({totalStrikes} in total)'
 
     embed.add_field(name='Punishments', value=punishments, inline=False)
-    return await ctx.send(embed=embed)
+    return embed
 
 
 class RiskyConfirmation(discord.ui.View):
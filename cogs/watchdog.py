@@ -0,0 +1,109 @@
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+
+import cogs.metrics as metrics
+
+watchdogFile = os.path.abspath(__file__)
+cogsDir = os.path.dirname(watchdogFile)
+
+
+class LoopWatchdog:
+    """
+    Detects callbacks that block the event loop. A task on the loop records a heartbeat every `interval`
+    seconds, and a daemon thread checks it. Once the heartbeat is more than `threshold` seconds old the
+    thread captures the loop thread's stack and logs it with the cog handler that was running
+
+    threshold: float, seconds the loop may go without a heartbeat before a stall is reported
+    interval: float, seconds between heartbeats
+    """
+
+    def __init__(self, threshold=0.5, interval=0.1):
+        self.threshold = threshold
+        self.interval = interval
+        self.stalls = 0
+        self._beat = time.monotonic()
+        self._loopThread = None
+        self._task = None
+        self._thread = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        """
+        Starts watching the running loop, must be called from the loop's thread
+        """
+        if self._task and not self._task.done():
+            return
+
+        self._loopThread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.create_task(self._heartbeat())
+        self._thread = threading.Thread(target=self._watch, name='loop-watchdog', daemon=True)
+        self._thread.start()
+        logging.info(f'[Watchdog] Watching for event loop stalls over {self.threshold}s')
+
+    def stop(self):
+        self._stopped.set()
+        if self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def _heartbeat(self):
+        while True:
+            self._beat = time.monotonic()
+            await asyncio.sleep(self.interval)
+            lag = time.monotonic() - self._beat - self.interval
+            if lag > self.threshold:
+                logging.warning(f'[Watchdog] Event loop resumed after a {lag:.3f}s stall')
+
+    def _watch(self):
+        reported = None  # Heartbeat of the stall already reported, so each stall is logged once
+        while not self._stopped.wait(self.threshold / 2):
+            beat = self._beat
+            blocked = time.monotonic() - beat
+            if blocked <= self.threshold or beat == reported:
+                continue
+
+            reported = beat
+            frame = sys._current_frames().get(self._loopThread)
+            if frame is None:
+                continue
+
+            self.stalls += 1
+            handler, location = _cog_frames(frame)
+            metrics.loopStalls.inc(handler=handler or 'unknown')
+            logging.warning(
+                f'[Watchdog] Event loop blocked for {blocked:.3f}s in {handler or "code outside the cogs"}'
+                f'{f" at {location}" if location else ""}, loop thread stack:\n{"".join(traceback.format_stack(frame))}'
+            )
+
+
+def _cog_frames(frame):
+    """
+    Walks a captured stack for the outermost frame inside cogs/, the handler the loop was running,
+    and the innermost one, where it was blocked. Returns them formatted, or (None, None)
+    """
+    frames = []  # Innermost first
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(cogsDir) and filename != watchdogFile:
+            frames.append(frame)
+
+        frame = frame.f_back
+
+    if not frames:
+        return None, None
+
+    outer, inner = frames[-1], frames[0]
+    location = f'{os.path.relpath(inner.f_code.co_filename, os.path.dirname(cogsDir))}:{inner.f_lineno}'
+    return _qualname(outer), f'{location} in {_qualname(inner)}'
+
+
+def _qualname(frame) -> str:
+    module = os.path.splitext(os.path.basename(frame.f_code.co_filename))[0]
+    return f'{module}.{getattr(frame.f_code, "co_qualname", frame.f_code.co_name)}'
@@ -5,6 +5,71 @@ token = 'token'
 
 # Mongo Credentials
 mongoURI = 'MongoDB URI'
+# Optional pymongo client options, i.e. pool sizes, timeouts and read/write concerns. Overrides cogs.database.clientDefaults
+mongoOptions = {'maxPoolSize': 50, 'w': 'majority'}
+
+# Store transcript messages as one document each in modmail.transcripts instead of
+# embedding them in the thread document. Run the migratetranscripts command after enabling
+splitTranscripts = False
+# Seconds to buffer transcript messages before writing them to the database in one batch
+transcriptFlushWindow = 0.5
+
+# bowser.users document cache used by blacklist checks and the info card. Enable the change stream
+# (requires a replica set) to invalidate cached documents as soon as they change
+userCacheSize = 2048
+userCacheTTL = 15
+userCacheChangeStream = False
+# Member, ban and user lookups against the Discord API are cached for memberCacheTTL seconds, and
+# "not in the guild"/"not banned" answers for memberNegativeTTL. Join, leave, ban and unban events update them
+memberCacheSize = 2048
+memberCacheTTL = 30
+memberNegativeTTL = 10
+# Seconds between reconciling the mirrored ban list of the primary guild with the API. Ban and unban
+# events keep it current in between
+banReconcileInterval = 3600
+# Seconds to collect appeal server joins before checking them for denied appeals in one query
+appealCheckWindow = 0.05
+
+# Inbound DMs are handled in order per user, with at most dmWorkers users handled at once.
+# Once dmQueueSize messages are waiting, new DMs wait for room before being queued
+dmWorkers = 8
+dmQueueSize = 500
+
+# Outbound messages are sent one at a time per channel, with at most outboundConcurrency sends at once.
+# Replies to users go first, then thread posts, then mod logs. Sends answered with 429 or a server error
+# once discord.py has given up are retried outboundRetries more times, backing off from outboundBackoff seconds
+outboundConcurrency = 5
+outboundRetries = 2
+outboundBackoff = 1.0
+
+# Seconds during which repeated DM typing events for a thread are not forwarded again.
+# Discord shows a typing indicator for 10 seconds
+typingWindow = 9
+
+# Largest moderator reply attachment, in bytes, that will be relayed to a user
+attachmentSizeLimit = 10 * 1024 * 1024
+
+# Gateway cache profile. 'lean' caches no members besides the bot itself, skips member chunking at startup and
+# resolves members on demand. 'full' caches and chunks every member of every guild. With 'lean', handlers for
+# events discord.py only dispatches for cached users or members use the raw events: on_raw_typing and
+# on_raw_member_remove
+cacheProfile = 'lean'
+# Messages kept in the message cache. Message reports can only show replies to messages that are still cached
+messageCacheSize = 5000
+
+# Trace handlers with the Mongo commands and Discord REST requests they issue. Spans are logged when they take
+# at least tracingLogThreshold seconds, and the last tracingWindow spans per handler are summarized by tracing.dump()
+tracing = False
+tracingLogThreshold = 0.0
+tracingWindow = 500
+
+# Serve Prometheus metrics at http://metricsHost:metricsPort/metrics. Disabled when metricsPort is None
+metricsPort = None
+metricsHost = '127.0.0.1'
+
+# Log the event loop's stack and the cog handler it was running whenever the loop is blocked for longer
+# than this many seconds. Set to None to disable the watchdog
+loopWatchdogThreshold = 0.5
 
 # Channel IDs
 modLog: int = mod_log_channel_id
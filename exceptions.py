@@ -6,6 +6,10 @@ class InvalidType(Exception):
     pass
 
 
+class AttachmentTooLarge(Exception):
+    pass
+
+
 class ModmailBlacklisted(Exception):
     pass
 